@@ -3,9 +3,61 @@
    Use: Initialize with the max depth, max object, and number of types. Pass structure to filter(), which returns a
         vector containing the types observed. To update attention, pass an integer vector of size
         max_depth*max_objects*2 to set().
+
+   The attention is held as a (max_depth, max_objects*2) array, each adjacent pair in a row is an attended type pair.
+   set() compiles it into table, a (max_depth, n_pairs) boolean array where table[i][pair_index(a, b)] tells if the
+   pair (a, b) is attended in layer i, so each pair is checked in constant time.
 """
 
 import random
+import numpy as np
+from create_structure import pair_index
+from genome import dtype_for
+
+
+def filter_batch(table, first, second, structure, n_samples):
+    """Attention.filter_batch() for a compiled attention table and emission order tables.
+
+    :return: :type tuple: (types, counts, n_pairs, n_hits), n_pairs the number of adjacent type pairs checked and n_hits
+                          the number of them attended.
+    """
+    counts = np.zeros(n_samples, dtype=np.intp)
+    n_pairs = 0
+    n_hits = 0
+    found_rows = []
+    found_positions = []
+    found_types = []
+    i = 0
+    for layer, sizes in structure:
+        if i >= len(table):
+            break
+        live = np.arange(layer.shape[1] - 1) < (sizes - 1)[:, None]
+        found = table[i][pair_index(layer[:, :-1], layer[:, 1:])] & live
+
+        # Pairs in row major order, i.e. per sample in the order filter() visits them
+        rows, columns = np.nonzero(found)
+        n_pairs += int(np.maximum(sizes - 1, 0).sum())
+        n_hits += len(rows)
+        left = layer[rows, columns]
+        right = layer[rows, columns + 1]
+        n_emitted = 1 + (left != right)
+
+        # Position of each pair's first type in its sample's output
+        ends = np.cumsum(n_emitted)
+        starts = ends - n_emitted
+        positions = counts[rows] + starts - starts[np.searchsorted(rows, rows)]
+
+        two = n_emitted == 2
+        found_rows += [rows, rows[two]]
+        found_positions += [positions, positions[two] + 1]
+        found_types += [first[left, right], second[left, right][two]]
+        counts += np.bincount(rows, weights=n_emitted, minlength=n_samples).astype(np.intp)
+        i += 1
+
+    types = np.zeros((n_samples, counts.max() if n_samples else 0), dtype=np.intp)
+    if found_rows:
+        types[np.concatenate(found_rows), np.concatenate(found_positions)] = np.concatenate(found_types)
+    return types, counts, n_pairs, n_hits
 
 
 class Attention:
@@ -16,40 +68,66 @@ class Attention:
         :param max_objects: The maximum number of type pairs to attend to in each layer of structure.
         :param n_types: The number of types in the structure.
         """
-        self.attention = [[{random.randint(1, n_types), random.randint(1, n_types)} for x in range(max_objects)]
-                          for x in range(max_depth)]
         self.max_objects = max_objects
         self.max_depth = max_depth
 
+        # Pairs of adjacent types checked by filter() and filter_batch(), and how many of them were attended
+        self.n_pairs = 0
+        self.n_hits = 0
+        self.table = np.zeros((max_depth, (n_types + 1)*(n_types + 2)//2), dtype=bool)
+        self.set(np.array([[random.randint(1, n_types) for x in range(max_objects*2)]
+                           for x in range(max_depth)], dtype=dtype_for(n_types)))
+
+        # Emission order of each type pair, the order filter() iterates the pair's set in
+        order = [[list({a, b}) for b in range(n_types + 1)] for a in range(n_types + 1)]
+        self.first = np.array([[x[0] for x in row] for row in order], dtype=np.intp)
+        self.second = np.array([[x[-1] for x in row] for row in order], dtype=np.intp)
+
     def set(self, new_attention):
         """Sets a new attention for the attender.
 
-        :param new_attention: :type iterable (int): An integer vector of size max_depth*max_objects*2.
+        :param new_attention: :type iterable (int): An integer vector of size max_depth*max_objects*2. Arrays are used
+                                                    without copying.
         """
-        for i in range(self.max_depth):
-            new_layer_copy = []
-            n_obj = self.max_objects*2
-            new_layer = new_attention[i*n_obj:(i+1)*n_obj]
-            for j in range(len(new_layer) - 1):
-                pair = {new_layer[j], new_layer[j + 1]}
-                new_layer_copy.append(pair)
-            self.attention[i] = new_layer_copy
+        self.attention = np.asarray(new_attention).reshape(self.max_depth, self.max_objects*2)
+
+        self.table[:] = False
+        layers = np.arange(self.max_depth)[:, None]
+        self.table[layers, pair_index(self.attention[:, :-1], self.attention[:, 1:])] = True
 
     def filter(self, structure):
         """Filters the structure by the current attention.
 
-        :param structure: :type list: A list of lists generated by Structure.
+        :param structure: :type iterable: A list of lists generated by Structure. Layers past max_depth are not consumed,
+                                          so a lazy structure is only computed as deep as the attention looks.
         :return: :type list: A list of the type relations found in the structure.
         """
         types = []
         i = 0
         for layer in structure:
-            if i < self.max_depth:
-                attention_l = self.attention[i]
-                for j in range(len(layer) - 1):
-                    pair = {layer[j], layer[j + 1]}
-                    if pair in attention_l:
-                        for symbol in pair:
-                            types.append(symbol)
+            if i >= self.max_depth:
+                break
+            layer = np.asarray(layer)
+            found = self.table[i][pair_index(layer[:-1], layer[1:])]
+            hits = np.flatnonzero(found)
+            self.n_pairs += len(found)
+            self.n_hits += len(hits)
+            for j in hits:
+                pair = {int(layer[j]), int(layer[j + 1])}
+                for symbol in pair:
+                    types.append(symbol)
             i += 1
         return types
+
+    def filter_batch(self, structure, n_samples):
+        """Batched filter(), emits the same types in the same order for every sample.
+
+        :param structure: :type iterable: (layer, sizes) pairs of a batch of structures, as generated by
+                                          Structure.layers_batch(). Layers past max_depth are not consumed.
+        :param n_samples: :type int: The number of samples in the batch.
+        :return: :type tuple: (types, counts). Row i of the 2-d array types holds the counts[i] types found in sample i.
+        """
+        types, counts, n_pairs, n_hits = filter_batch(self.table, self.first, self.second, structure, n_samples)
+        self.n_pairs += n_pairs
+        self.n_hits += n_hits
+        return types, counts
@@ -0,0 +1,68 @@
+"""Padded minibatches of integer-encoded samples.
+
+   Use: Pass a list of 1-d integer sequences (e.g. from SemanticalMapper.encode()) and their targets to pad() to get a
+        Batch. samples is a 2-d array with one sample per row, padded with 0 after the first lengths[i] entries of row
+        i. Call take() with row indexes to gather a smaller batch. A batch may carry a key identifying its samples,
+        batches with equal keys hold the same samples. Each sample has a weight, the number of samples it stands for,
+        see correct().
+"""
+
+import hashlib
+import numpy as np
+
+
+class Batch:
+
+    def __init__(self, samples, lengths, targets=None, key=None, weights=None):
+        """
+        :param samples: :type np.ndarray: A 2-d integer array, one padded sample per row.
+        :param lengths: :type np.ndarray: The number of valid entries at the start of each row.
+        :param targets: :type np.ndarray: The integer target of each sample, if known.
+        :param key: A hashable identifying the samples, None if unknown.
+        :param weights: :type np.ndarray: The integer weight of each sample, None for ones.
+        """
+        self.samples = samples
+        self.lengths = lengths
+        self.targets = targets
+        self.key = key
+        self.weights = weights if weights is not None else np.ones(len(lengths), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def correct(self, outputs, start=0):
+        """
+        :param outputs: :type np.ndarray: Outputs of the samples from start on.
+        :return: :type int: The total weight of those samples whose output is their target.
+        """
+        stop = start + len(outputs)
+        return int(np.dot(outputs == self.targets[start:stop], self.weights[start:stop]))
+
+    def take(self, indexes):
+        """
+        :param indexes: :type iterable (int): Rows to gather, may repeat.
+        :return: :type Batch: A new batch of the given rows, trimmed to its longest sample.
+        """
+        indexes = np.asarray(indexes, dtype=np.intp)
+        lengths = self.lengths[indexes]
+        width = lengths.max() if len(lengths) else 0
+        targets = self.targets[indexes] if self.targets is not None else None
+        key = (self.key, hashlib.md5(indexes).digest()) if self.key is not None else None
+        return Batch(self.samples[indexes, :width], lengths, targets, key, self.weights[indexes])
+
+
+def pad(sequences, targets=None, dtype=np.int32, key=None):
+    """
+    :param sequences: :type list: 1-d integer sequences.
+    :param targets: :type list (int): The target of each sequence, optional.
+    :param dtype: The dtype of the padded samples.
+    :param key: The key of the batch, see Batch.
+    :return: :type Batch: The sequences padded with 0 to the longest one.
+    """
+    lengths = np.array([len(x) for x in sequences], dtype=np.intp)
+    samples = np.zeros((len(sequences), lengths.max() if len(lengths) else 0), dtype=dtype)
+    for i in xrange(len(sequences)):
+        samples[i, :lengths[i]] = sequences[i]
+    if targets is not None:
+        targets = np.asarray(targets, dtype=np.intp)
+    return Batch(samples, lengths, targets, key)
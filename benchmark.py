@@ -0,0 +1,218 @@
+"""Times the stages of a Constructor on synthetic datasets.
+
+   Use: python benchmark.py [results.json] [--quick]
+        Runs every configuration of grid() and writes the timings to results.json (benchmark.json by default), so runs
+        can be compared. --quick only runs the base configuration and the one of train_constructor.py.
+
+        Each configuration gets a synthetic dataset written by synthesize(), in the pickle layout Constructor loads. A
+        Constructor with random genes is timed stage by stage, once through the per-sample compute() path and once
+        through the batched path, then on the scoring of a whole generation. Caches are disabled, so every repeat does
+        the full work.
+
+   Results are a JSON object: "meta" describes the run, "results" holds one record per configuration and stage, with
+   the configuration, the stage, the best time of the repeats in seconds and that time per sample (per individual for
+   the generation).
+"""
+
+import cPickle
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import random as r
+import numpy as np
+from constructor import Constructor
+
+# Configuration of train_constructor.py
+TRAIN_CONSTRUCTOR = {"n_objects": 1000, "n_types": 50, "max_attention_depth": 100, "max_attention_objects": 50,
+                     "computer_depth": 100, "n_functions": 1000, "batch_size": 1000}
+
+BASE = {"length": 200, "n_samples": 400, "n_objects": 40, "n_types": 6, "max_attention_depth": 4,
+        "max_attention_objects": 5, "computer_depth": 5, "n_functions": 7, "batch_size": 200, "population_size": 20}
+
+# Values each parameter is swept over, the others kept at BASE
+SWEEPS = [("length", [50, 200, 800, 3200]),
+          ("n_objects", [40, 200, 1000]),
+          ("n_types", [6, 20, 50]),
+          (("max_attention_depth", "max_attention_objects"), [(4, 5), (20, 10), (100, 50)]),
+          ("computer_depth", [5, 20, 100])]
+
+
+def grid(quick=False):
+    """
+    :param quick: :type bool: Only the base configuration and the one of train_constructor.py.
+    :return: :type list: Configurations, dicts of synthesize() and Constructor arguments with a name and the size of
+                         the timed generation.
+    """
+    configs = [dict(BASE, name="base")]
+    if not quick:
+        for parameter, values in SWEEPS:
+            for value in values:
+                config = dict(BASE)
+                if isinstance(parameter, tuple):
+                    config.update(zip(parameter, value))
+                else:
+                    config[parameter] = value
+                if config != BASE:
+                    config["name"] = "%s=%s" % ("/".join(parameter) if isinstance(parameter, tuple) else parameter,
+                                                value)
+                    configs.append(config)
+    # An individual takes tens of seconds to score at this size
+    configs.append(dict(TRAIN_CONSTRUCTOR, name="train_constructor", length=800, n_samples=2000, population_size=2))
+    return configs
+
+
+def synthesize(path, n_samples, length, n_classes=2, n_symbols=20, seed=0):
+    """Writes a classification dataset in the layout Constructor loads: a pickled list of rows [id, target, symbols...].
+    The symbols of a sample are drawn from a distribution that depends on its class.
+
+    :param length: :type int: Mean number of symbols per sample, lengths vary by up to a quarter of it.
+    :param n_classes: :type int: Number of targets, at most 10.
+    :param n_symbols: :type int: Size of the alphabet, at most 26.
+    """
+    random_state = np.random.RandomState(seed)
+    alphabet = np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ"[:n_symbols]))
+    distributions = random_state.dirichlet(np.ones(n_symbols), n_classes)
+
+    rows = []
+    for i in xrange(n_samples):
+        target = random_state.randint(n_classes)
+        n = max(1, length + random_state.randint(-(length//4), length//4 + 1))
+        rows.append([i, target] + alphabet[random_state.choice(n_symbols, n, p=distributions[target])].tolist())
+
+    outfile = open(path, "wb")
+    cPickle.dump(rows, outfile, cPickle.HIGHEST_PROTOCOL)
+    outfile.close()
+
+
+def best_time(function, repeat):
+    """
+    :return: :type float: The shortest of repeat runs of function, in seconds.
+    """
+    times = []
+    for i in xrange(repeat):
+        start = time.time()
+        function()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def random_chromosome(constructor, random_state):
+    return np.concatenate([random_state.randint(0, constructor.layout.highs[name] + 1, constructor.layout.sizes[name])
+                           for name in constructor.layout.names]).astype(constructor.layout.dtype)
+
+
+def time_stages(constructor, samples, repeat):
+    """Times the stages of compute() on each of samples, feeding every stage the outputs of the one before.
+
+    :param samples: :type list: Raw inputs.
+    :return: :type dict: Seconds taken by each stage over all samples.
+    """
+    mapped = [constructor.input_mapper.compute(x) for x in samples]
+    structures = [constructor.structure.make(x) for x in mapped]
+    typed = [[constructor.semantical_mapper.compute(layer) for layer in s] for s in structures]
+    filtered = [constructor.attention.filter(s) for s in typed]
+    computed = [constructor.type_computer.compute(x) for x in filtered]
+
+    return {"input_mapper": best_time(lambda: [constructor.input_mapper.compute(x) for x in samples], repeat),
+            "structure": best_time(lambda: [constructor.structure.make(x) for x in mapped], repeat),
+            "semantical_mapper": best_time(lambda: [[constructor.semantical_mapper.compute(layer) for layer in s]
+                                                    for s in structures], repeat),
+            "attention": best_time(lambda: [constructor.attention.filter(s) for s in typed], repeat),
+            "type_computer": best_time(lambda: [constructor.type_computer.compute(x) for x in filtered], repeat),
+            "output_mapper": best_time(lambda: [constructor.output_mapper.compute(x) for x in computed], repeat),
+            "compute": best_time(lambda: [constructor.compute(x) for x in samples], repeat)}
+
+
+def time_batch_stages(constructor, batch, repeat):
+    """Times the stages of compute_batch() on a batch.
+
+    :param batch: :type batch.Batch: Samples as gathered by Constructor.minibatch().
+    :return: :type dict: Seconds taken by each stage over the batch.
+    """
+    depth = constructor.max_attention_depth
+    mapped = constructor.input_mapper.compute_batch(batch.samples)
+    structure = [(constructor.semantical_mapper.compute_batch(layer), sizes)
+                 for layer, sizes in constructor.structure.layers_batch(mapped, batch.lengths, depth)]
+    filtered, counts = constructor.attention.filter_batch(structure, len(batch))
+
+    def type_computer():
+        # Compiled tables are rebuilt by every new chromosome, so they are timed too
+        constructor.type_computer.set(constructor.type_computer.path)
+        constructor.type_computer.compute_last(filtered, counts)
+
+    return {"batch.input_mapper": best_time(lambda: constructor.input_mapper.compute_batch(batch.samples), repeat),
+            "batch.structure": best_time(lambda: list(constructor.structure.layers_batch(mapped, batch.lengths, depth)),
+                                         repeat),
+            "batch.semantical_mapper": best_time(lambda: [constructor.semantical_mapper.compute_batch(layer)
+                                                          for layer, sizes in structure], repeat),
+            "batch.attention": best_time(lambda: constructor.attention.filter_batch(structure, len(batch)), repeat),
+            "batch.type_computer": best_time(type_computer, repeat),
+            "compute_batch": best_time(lambda: constructor.compute_batch(batch.samples, batch.lengths), repeat)}
+
+
+def run(config, directory, repeat=3, n_scalar=50):
+    """
+    :param config: :type dict: A configuration of grid().
+    :param directory: :type str: Where the synthetic dataset is written.
+    :param n_scalar: :type int: Number of samples timed through the per-sample path.
+    :return: :type list: One result record per stage.
+    """
+    datafile = os.path.join(directory, "synthetic_%d_%d.pkl" % (config["n_samples"], config["length"]))
+    if not os.path.exists(datafile):
+        synthesize(datafile, config["n_samples"], config["length"])
+
+    r.seed(0)
+    constructor = Constructor(datafile, config["n_objects"], config["n_types"], config["max_attention_depth"],
+                              config["max_attention_objects"], config["computer_depth"], config["n_functions"],
+                              test_fraction=.25, stochastic=True, batch_size=config["batch_size"],
+                              save_file=os.path.join(directory, "best.pkl"), stage_cache_size=0, fitness_cache_size=0)
+
+    random_state = np.random.RandomState(0)
+    constructor.decode(random_chromosome(constructor, random_state))
+
+    samples = [constructor.dataset.input(i) for i in constructor.train_data[:n_scalar]]
+    batch = constructor.minibatch("train", np.arange(min(config["batch_size"], len(constructor.train_data))))
+
+    times = [(stage, seconds, len(samples)) for stage, seconds in time_stages(constructor, samples, repeat).items()]
+    times += [(stage, seconds, len(batch)) for stage, seconds in time_batch_stages(constructor, batch, repeat).items()]
+
+    # A generation scores every individual on the train minibatch only. Chromosomes that beat the best score are
+    # tested in the background, which report_test=False leaves out of the time.
+    population = [random_chromosome(constructor, random_state) for i in xrange(config["population_size"])]
+    seconds = best_time(lambda: constructor.evaluate_population(population, report_test=False), 1)
+    times.append(("generation", seconds, len(population)))
+
+    return [dict(config, stage=stage, seconds=seconds, per_sample=seconds/max(n, 1))
+            for stage, seconds, n in sorted(times)]
+
+
+def main(argv):
+    quick = "--quick" in argv
+    paths = [x for x in argv if not x.startswith("--")]
+    output = paths[0] if paths else "benchmark.json"
+
+    directory = tempfile.mkdtemp(prefix="benchmark")
+    meta = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+            "numpy": np.__version__, "machine": platform.machine(), "node": platform.node(), "quick": quick}
+    results = []
+    try:
+        for config in grid(quick):
+            records = run(config, directory)
+            for record in records:
+                print "%-40s %-25s %10.4fs %12.2fus" % (record["name"], record["stage"], record["seconds"],
+                                                        record["per_sample"]*1e6)
+            results += records
+    finally:
+        shutil.rmtree(directory)
+
+    outfile = open(output, "w")
+    json.dump({"meta": meta, "results": results}, outfile, indent=1, sort_keys=True)
+    outfile.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,108 @@
+"""Atomic checkpoint files, written on a background thread.
+
+   Use: Initialize a Checkpointer and call save() with a path and a picklable object, it returns at once and the
+        object is pickled and written by the writer thread. Objects must not be modified after they are passed to
+        save(). When several objects are saved to the same path before the writer gets to it, only the last one is
+        written. Call flush() to wait for pending writes and close() when done. load() reads a checkpoint back.
+
+        Every file is written to a temporary file in the same directory, then renamed over the path, so a checkpoint
+        is either the old or the new one, never a partial write.
+"""
+
+import cPickle
+import os
+import tempfile
+import threading
+
+
+def write(path, obj):
+    """Pickles obj to path atomically."""
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=name + ".", suffix=".tmp", dir=directory)
+    try:
+        outfile = os.fdopen(fd, "wb")
+        try:
+            cPickle.dump(obj, outfile, cPickle.HIGHEST_PROTOCOL)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        finally:
+            outfile.close()
+        os.rename(temp_path, path)
+    except:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def load(path):
+    """
+    :return: The object pickled at path, None if there is no such file.
+    """
+    if not os.path.exists(path):
+        return None
+    infile = open(path, "rb")
+    obj = cPickle.load(infile)
+    infile.close()
+    return obj
+
+
+class Checkpointer:
+
+    def __init__(self):
+        # Objects waiting to be written, the latest one per path
+        self.pending = {}
+        self.writing = False
+        self.closed = False
+        self.error = None
+        self.condition = threading.Condition()
+
+        self.thread = threading.Thread(target=self.run, name="checkpointer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def save(self, path, obj):
+        """Queues obj to be written to path. Raises the error of a failed earlier write, if any."""
+        with self.condition:
+            self.check()
+            self.pending[path] = obj
+            self.condition.notify_all()
+
+    def flush(self):
+        """Waits until all queued objects are written."""
+        with self.condition:
+            while (self.pending or self.writing) and self.error is None:
+                self.condition.wait()
+            self.check()
+
+    def close(self):
+        """Writes the queued objects and stops the writer thread."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+        self.check()
+
+    def check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                path, obj = self.pending.popitem()
+                self.writing = True
+
+            try:
+                write(path, obj)
+            except Exception as e:
+                with self.condition:
+                    self.error = e
+
+            with self.condition:
+                self.writing = False
+                self.condition.notify_all()
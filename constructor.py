@@ -26,13 +26,23 @@ from semantical_mapper import SemanticalMapper
 from attention import Attention
 from type_computer import TypeComputer
 from output_mapper import OutputMapper
+from genome import Layout, ArrayGenome
+from lru import LRUCache
+from sampler import Sampler
+from profiler import Profile
+import dataset
+import checkpoint
+import islands
+import numpy as np
 import cPickle
-from pyevolve import G1DList
-from pyevolve import GSimpleGA
+import collections
+import copy
+import hashlib
+import os
+import time
+from engine import GeneticAlgorithm
+from evaluator import PoolEvaluator, TestEvaluator
 from pyevolve import Selectors
-from pyevolve import Mutators
-from pyevolve import Initializators
-from pyevolve import GAllele
 from pyevolve import Consts
 import random as r
 
@@ -41,9 +51,11 @@ class Constructor:
 
     def __init__(self, datafile, n_objects, n_types, max_attention_depth, max_attention_objects,
                  computer_depth, n_functions, test_fraction=0, data_fraction=1, stochastic=False, batch_size=0,
-                 save_file="best_construct.pkl", sep_features_targets=False):
+                 save_file="best_construct.pkl", sep_features_targets=False, stage_cache_size=0,
+                 fitness_cache_size=2**26, stratified=False):
         """
-        :param datafile: A list containing input/target pairs, e.g. [[input, target], ...]
+        :param datafile: A pickled list containing input/target pairs, e.g. [[input, target], ...], or a directory
+                         written by dataset.convert(), which is memory-mapped.
         :param data_fraction: Fraction of the dataset to use.
         :param test_fraction: The fraction of the dataset to reserve for testing.
         :param n_objects: The number of objects which Structure reduces the data to.
@@ -54,6 +66,14 @@ class Constructor:
         :param computer_depth: The number of times types will be recursively passed through the functions of
                                TypeComputer.
         :param n_functions: The size of the function set of TypeComputer.
+        :param stage_cache_size: Bytes of stage outputs kept for reuse by individuals that share the genes of the stages
+                                 producing them, 0 to disable. An output is only reused for the same samples and the
+                                 same genes up to the semantical mapper, so this pays off only when not stochastic and
+                                 children often keep those genes whole, e.g. with a mutation rate far below one per
+                                 upstream segment. Each worker keeps its own cache.
+        :param fitness_cache_size: Bytes of scores kept for reuse by identical chromosomes scored on the same
+                                   minibatches, 0 to disable.
+        :param stratified: If stochastic, whether minibatches keep the class proportions of their split.
         """
 
         self.n_objects = n_objects
@@ -66,60 +86,105 @@ class Constructor:
         self.batch_size = batch_size
         self.save_file = save_file
 
+        # Best test accuracy and best train score so far. Only chromosomes that beat the best train score are tested.
         self.best_fit = 0.0
+        self.best_score = -1.0
+        # Test accuracies not printed yet, see print_tests()
+        self.tested = []
+        self.tester = None
+        self.workers = None
+        self.checkpointer = None
+        # Profile of the computations, see profiler.Profile
+        self.profile = None
+        # Score an individual must still be able to reach to be scored further, see race_batch()
+        self.threshold = None
+        # (first slice size, rate) of successive halving, see evaluate_halving()
+        self.halving = None
+        self.stage_cache = LRUCache(stage_cache_size) if stage_cache_size > 0 else None
+        # Semantically mapped structures of the group being scored and the number of times they were reused, see
+        # score_group()
+        self.shared_stages = None
+        self.shared_hits = 0
+        # (upstream key, size, hits) of each group of the last tasks scored, see run_tasks()
+        self.group_stats = []
+        self.fitness_cache = LRUCache(fitness_cache_size) if fitness_cache_size > 0 else None
+
+        if os.path.isdir(datafile):
+            self.dataset = dataset.load(datafile)
+        else:
+            self.dataset = dataset.from_pickle(datafile, sep_features_targets)
 
-        df = open(datafile, "rb")
-        self.data = cPickle.load(df)
-        df.close()
-
-        features = [str(self.data[i][2:]) for i in range(len(self.data))]
-        targets = [str(self.data[i][1]) for i in range(len(self.data))]
-
-        self.data = zip(features, targets)
-
-        if sep_features_targets:
-            self.data = zip(self.data[0], self.data[1])
-
+        # Rows of the dataset in use
+        rows = np.arange(len(self.dataset))
         if data_fraction < 1:
-            self.data = [pair for pair in self.data if r.random() < data_fraction]
+            random_state = np.random.RandomState(r.getrandbits(32))
+            rows = rows[random_state.random_sample(len(rows)) < data_fraction]
 
-        print self.data[0][0]
-        print self.data[0][1]
+        print self.dataset.input(rows[0])
+        print self.dataset.targets[rows[0]]
 
-        train_len = int(round(len(self.data)*(1 - test_fraction)))
-        self.train_data = self.data[:train_len]
-        self.test_data = self.data[train_len:]
+        train_len = int(round(len(rows)*(1 - test_fraction)))
+        self.train_data = rows[:train_len]
+        self.test_data = rows[train_len:]
 
         print len(self.train_data)
         print len(self.test_data)
 
-        inputs = []
-        outputs = []
-        input_symbols = []
-
-        for pair in self.data:
-            inputs.append(pair[0])
-            outputs.append(pair[1])
+        # Whole splits gathered for non-stochastic evaluation and the last minibatch gathered from each split, see
+        # minibatch()
+        self.splits = {}
+        self.batches = {}
 
-        for x in inputs:
-            for y in x:
-                input_symbols.append(y)
+        # Minibatches of stochastic evaluation, see draw()
+        self.samplers = {}
+        if stochastic:
+            self.samplers["train"] = Sampler(self.dataset.targets[self.train_data], batch_size, r.getrandbits(32),
+                                             stratified)
+            self.samplers["test"] = Sampler(self.dataset.targets[self.test_data], batch_size/2, r.getrandbits(32),
+                                            stratified)
 
         # Initialize layers
-        self.input_mapper = SemanticalMapper(first_layer=True, inputs=input_symbols)
+        self.input_mapper = SemanticalMapper(first_layer=True, inputs=self.dataset.vocabulary.tolist())
         self.structure = Structure(n_objects)
         self.semantical_mapper = SemanticalMapper(n_objects, n_types)
         self.attention = Attention(max_attention_depth, max_attention_objects, n_types)
         self.type_computer = TypeComputer(max_attention_depth*max_attention_objects*2, num_functions=self.n_functions,
                                           depth=computer_depth, n_types=self.n_types)
-        self.output_mapper = OutputMapper(n_types, outputs)
+        self.output_mapper = OutputMapper(n_types, np.unique(self.dataset.targets))
+
+        # Chromosome layout, one segment per layer
+        self.layout = Layout([("input_mapper", self.input_mapper.n_symbols, self.input_mapper.n_symbols),
+                              ("structure", len(self.structure.r_map), self.n_objects),
+                              ("semantical_mapper", len(self.semantical_mapper.map), self.n_types),
+                              ("attention", self.max_attention_depth*self.max_attention_objects*2, self.n_types),
+                              ("type_computer", self.type_computer.path.size, self.n_functions - 1),
+                              ("output_mapper", self.n_types + 1, self.output_mapper.n_symbols)])
+
+    def minibatch(self, split, indexes=None):
+        """
+        :param split: :type str: "train" or "test".
+        :param indexes: :type iterable (int): Positions in the split to gather, None for the whole split.
+        :return: :type batch.Batch: The samples, encoded with the codes of input_mapper.symbol_set.
+        """
+        rows = self.train_data if split == "train" else self.test_data
+        if indexes is not None:
+            # A generation is scored on one minibatch, gathered once per process
+            indexes = np.asarray(indexes, dtype=np.intp)
+            key = hashlib.md5(indexes).digest()
+            if split not in self.batches or self.batches[split][0] != key:
+                self.batches[split] = key, self.dataset.take(rows[indexes])
+            return self.batches[split][1]
+        if split not in self.splits:
+            self.splits[split] = self.dataset.take(rows)
+        return self.splits[split]
 
     def compute(self, data):
+        if self.profile is not None:
+            return self.compute_profiled(data)
+
         mapped = self.input_mapper.compute(data)
-        structure = self.structure.make(mapped)
-        for i in range(len(structure)):
-            structure[i] = self.semantical_mapper.compute(structure[i])
-        filtered = self.attention.filter(structure)
+        structure = self.structure.layers(mapped, self.max_attention_depth)
+        filtered = self.attention.filter(self.semantical_mapper.compute(layer) for layer in structure)
         outputs = self.type_computer.compute(filtered)
         outputs = self.output_mapper.compute(outputs)
 
@@ -130,227 +195,667 @@ class Constructor:
 
         return output
 
+    def compute_profiled(self, data):
+        """compute() with every stage timed in self.profile."""
+        profile = self.profile
+
+        start = time.time()
+        mapped = self.input_mapper.compute(data)
+        profile.add("input_mapper", start)
+
+        start = time.time()
+        structure = list(self.structure.layers(mapped, self.max_attention_depth))
+        profile.add("structure", start)
+
+        start = time.time()
+        structure = [self.semantical_mapper.compute(layer) for layer in structure]
+        profile.add("semantical_mapper", start)
+
+        start = time.time()
+        n_pairs, n_hits = self.attention.n_pairs, self.attention.n_hits
+        filtered = self.attention.filter(structure)
+        profile.add("attention", start)
+
+        start = time.time()
+        outputs = self.type_computer.compute(filtered)
+        profile.add("type_computer", start)
+
+        start = time.time()
+        outputs = self.output_mapper.compute(outputs)
+        profile.add("output_mapper", start)
+
+        profile.count("samples", 1)
+        profile.count("structures", 1)
+        profile.count("depth", len(structure))
+        profile.count("width", len(mapped))
+        profile.count("pairs", self.attention.n_pairs - n_pairs)
+        profile.count("hits", self.attention.n_hits - n_hits)
+        profile.count("outputs", len(outputs))
+
+        if len(outputs) != 0:
+            return int(outputs[-1])
+        return 1
+
+    def compute_batch(self, samples, lengths, default=1, chunk_size=256, key=None):
+        """Batched compute(), gives the same output for every sample.
+
+        :param samples: :type np.ndarray: A 2-d array of samples encoded with input_mapper.encode(), padded with 0.
+        :param lengths: :type np.ndarray: The length of each sample.
+        :param default: :type int: Output of samples for which the computer outputs nothing.
+        :param chunk_size: :type int: Number of samples computed together, bounds memory use.
+        :param key: :type tuple: Stage keys of the samples and current genes, see stage_keys(). Stage outputs are
+                                 cached and reused under them if given.
+        :return: :type np.ndarray: The output of each sample.
+        """
+        outputs = np.empty(len(lengths), dtype=np.intp)
+        for start in xrange(0, len(lengths), chunk_size):
+            chunk_lengths = lengths[start:start + chunk_size]
+            chunk = samples[start:start + chunk_size, :chunk_lengths.max()]
+            chunk_key = (key[0] + (start,), key[1] + (start,)) if key is not None else None
+
+            filtered, counts = self.compute_stages(chunk, chunk_lengths, chunk_key)
+
+            if self.profile is not None:
+                started = time.time()
+            last = self.type_computer.compute_last(filtered, counts)
+            if self.profile is not None:
+                self.profile.add("type_computer", started)
+                self.profile.count("samples", len(chunk_lengths))
+                self.profile.count("outputs", int(self.type_computer.count_outputs(filtered, counts).sum()))
+                started = time.time()
+
+            outputs[start:start + chunk_size] = np.where(last >= 0, self.output_mapper.compute(np.maximum(last, 0)),
+                                                         default)
+            if self.profile is not None:
+                self.profile.add("output_mapper", started)
+        return outputs
+
+    def compute_stages(self, samples, lengths, key=None):
+        """Runs a chunk of samples through the stages up to Attention. With a key, a stage is skipped when its output
+        for the same samples and the same genes of it and every stage before it is in the stage cache, or was computed
+        for the group being scored.
+
+        :param key: :type tuple: (structure_key, attention_key), see stage_keys().
+        :return: :type tuple: (types, counts) as returned by Attention.filter_batch().
+        """
+        structure = None
+        if key is not None:
+            if self.stage_cache is not None:
+                filtered = self.stage_cache.get(key[1])
+                if filtered is not None:
+                    return filtered
+            if self.shared_stages is not None and key[0] in self.shared_stages:
+                structure = self.shared_stages[key[0]]
+                self.shared_hits += 1
+            elif self.stage_cache is not None:
+                structure = self.stage_cache.get(key[0])
+
+        if structure is None:
+            if self.profile is not None:
+                structure = self.structure_profiled(samples, lengths)
+            else:
+                # Only the layers Attention looks at are computed, one at a time, and each is consumed before the next
+                mapped = self.input_mapper.compute_batch(samples)
+                structure = ((self.semantical_mapper.compute_batch(layer), sizes)
+                             for layer, sizes in self.structure.layers_batch(mapped, lengths, self.max_attention_depth))
+            if key is not None:
+                structure = list(structure)
+                if self.stage_cache is not None:
+                    self.stage_cache.put(key[0], structure)
+        if key is not None and self.shared_stages is not None:
+            self.shared_stages[key[0]] = structure
+
+        if self.profile is not None:
+            start = time.time()
+            n_pairs, n_hits = self.attention.n_pairs, self.attention.n_hits
+        filtered = self.attention.filter_batch(structure, len(lengths))
+        if self.profile is not None:
+            self.profile.add("attention", start)
+            self.profile.count("pairs", self.attention.n_pairs - n_pairs)
+            self.profile.count("hits", self.attention.n_hits - n_hits)
+        if key is not None and self.stage_cache is not None:
+            self.stage_cache.put(key[1], filtered)
+        return filtered
+
+    def structure_profiled(self, samples, lengths):
+        """The semantically mapped structure of compute_stages(), with every stage timed in self.profile.
+
+        :return: :type list: (layer, sizes) pairs, as deep as Attention looks.
+        """
+        profile = self.profile
+
+        start = time.time()
+        mapped = self.input_mapper.compute_batch(samples)
+        profile.add("input_mapper", start)
+
+        start = time.time()
+        structure = list(self.structure.layers_batch(mapped, lengths, self.max_attention_depth))
+        profile.add("structure", start)
+
+        start = time.time()
+        structure = [(self.semantical_mapper.compute_batch(layer), sizes) for layer, sizes in structure]
+        profile.add("semantical_mapper", start)
+
+        profile.count("structures", len(lengths))
+        profile.count("depth", int(sum(np.count_nonzero(sizes) for layer, sizes in structure)))
+        profile.count("width", int(np.sum(lengths)))
+        return structure
+
+    def stage_keys(self, samples, digests):
+        """
+        :param samples: :type batch.Batch: The samples to compute.
+        :param digests: :type dict: Segment digests of the current genes, see Layout.digests().
+        :return: :type tuple: Cache keys of the semantically mapped structure, as deep as Attention looks, and of the
+                              attention output. None if the samples have no key or stages are neither cached nor
+                              shared.
+        """
+        if self.stage_cache is None and self.shared_stages is None or samples.key is None or digests is None:
+            return None
+        structure_key = (samples.key,) + self.upstream_key(digests)
+        return structure_key, structure_key + (digests["attention"],)
+
+    @staticmethod
+    def upstream_key(digests):
+        """
+        :param digests: :type dict: Segment digests of some genes, see Layout.digests().
+        :return: :type tuple: The digests of the stages up to the semantically mapped structure.
+        """
+        return digests["input_mapper"], digests["structure"], digests["semantical_mapper"]
+
+    def evaluate_batch(self, samples, digests=None):
+        """
+        :param samples: :type batch.Batch: Samples with targets.
+        :param digests: :type dict: Segment digests of the current genes, enables the stage cache.
+        :return: :type tuple: (outputs, accuracy) for classification, samples without output are classified as 0. The
+                              accuracy is weighted by the weights of the samples.
+        """
+        outputs = self.compute_batch(samples.samples, samples.lengths, default=0,
+                                     key=self.stage_keys(samples, digests))
+        return outputs, float(samples.correct(outputs))/samples.weights.sum()
+
+    def race_batch(self, samples, threshold, digests=None, chunk_size=64):
+        """Accuracy on samples, computed chunk by chunk and abandoned once it can no longer reach threshold.
+
+        :param samples: :type batch.Batch: Samples with targets.
+        :param threshold: :type float: The accuracy to reach.
+        :param digests: :type dict: Segment digests of the current genes, enables the stage cache.
+        :param chunk_size: :type int: Number of samples computed between checks.
+        :return: :type tuple: (accuracy, finished). If not finished, accuracy is the highest the samples left could
+                              have brought it to, which is below threshold.
+        """
+        key = self.stage_keys(samples, digests)
+        n = len(samples)
+        # Weight of the samples after each chunk
+        remaining = np.cumsum(samples.weights[::-1])[::-1].tolist() + [0]
+        total = remaining[0]
+        correct = 0
+        for start in xrange(0, n, chunk_size):
+            stop = min(start + chunk_size, n)
+            chunk_key = (key[0] + ("race", start), key[1] + ("race", start)) if key is not None else None
+            outputs = self.compute_batch(samples.samples[start:stop], samples.lengths[start:stop], default=0,
+                                         chunk_size=chunk_size, key=chunk_key)
+            correct += samples.correct(outputs, start)
+
+            bound = float(correct + remaining[stop])/total
+            if bound < threshold and stop < n:
+                if self.profile is not None:
+                    self.profile.count("aborted", 1)
+                    self.profile.count("skipped", n - stop)
+                return bound, False
+        return float(correct)/total, True
+
     def set(self, savefile):
         cfile = open(savefile, "rb")
         chromosome = cPickle.load(cfile)
+        cfile.close()
 
-        index = 0
-        set_input_mapper = chromosome[0:self.input_mapper.n_symbols]
-        index += self.input_mapper.n_symbols
-        set_structure_rmap = chromosome[index:index+len(self.structure.r_map)]
-        index += len(self.structure.r_map)
-        set_semantical_mapper = chromosome[index:index+len(self.semantical_mapper.map)]
-        index += len(self.semantical_mapper.map)
-        set_attention = chromosome[index:index+self.max_attention_depth*self.max_attention_objects*2]
-        index += self.max_attention_depth*self.max_attention_objects*2
-        set_computer = chromosome[index:index+len(self.type_computer.path)*len(self.type_computer.path[0])]
-        index += len(self.type_computer.path)*len(self.type_computer.path[0])
-        set_output_mapper = chromosome[index:]
-
-        self.input_mapper.set(set_input_mapper)
-        self.structure.set(set_structure_rmap)
-        self.semantical_mapper.set(set_semantical_mapper)
-        self.attention.set(set_attention)
-        self.type_computer.set(set_computer)
-        self.output_mapper.set(set_output_mapper)
+        self.decode(chromosome)
 
-    def eval_func(self, chromosome, report_test=True):
+    def decode(self, chromosome):
+        """Sets every layer from a chromosome. Layers hold views into one gene buffer, no genes are copied per layer.
+
+        :param chromosome: A pyevolve genome, a gene array or a list of ints laid out as self.layout.
+        :return: :type np.ndarray: The gene buffer.
+        """
+        genes = self.layout.as_array(chromosome)
+        segments = self.layout.split(genes)
+
+        self.input_mapper.set(segments["input_mapper"])
+        self.structure.set(segments["structure"])
+        self.semantical_mapper.set(segments["semantical_mapper"])
+        self.attention.set(segments["attention"])
+        self.type_computer.set(segments["type_computer"])
+        self.output_mapper.set(segments["output_mapper"])
+
+        return genes
 
-        error = 0.0
-        error_local = 0.0
-        test_error = 0.0
-        test_error_local = 0.0
-
-        index = 0
-        set_input_mapper = chromosome[0:self.input_mapper.n_symbols]
-        index += self.input_mapper.n_symbols
-        set_structure_rmap = chromosome[index:index+len(self.structure.r_map)]
-        index += len(self.structure.r_map)
-        set_semantical_mapper = chromosome[index:index+len(self.semantical_mapper.map)]
-        index += len(self.semantical_mapper.map)
-        set_attention = chromosome[index:index+self.max_attention_depth*self.max_attention_objects*2]
-        index += self.max_attention_depth*self.max_attention_objects*2
-        set_computer = chromosome[index:index+len(self.type_computer.path)*len(self.type_computer.path[0])]
-        index += len(self.type_computer.path)*len(self.type_computer.path[0])
-        set_output_mapper = chromosome[index:]
-
-        self.input_mapper.set(set_input_mapper)
-        self.structure.set(set_structure_rmap)
-        self.semantical_mapper.set(set_semantical_mapper)
-        self.attention.set(set_attention)
-        self.type_computer.set(set_computer)
-        self.output_mapper.set(set_output_mapper)
+    def draw(self):
+        """Draws the next minibatches from the samplers of this process.
 
+        :return: :type tuple: (train_indexes, test_indexes), both None if not stochastic.
+        """
         if self.stochastic:
-            indexes = [r.randint(0, len(self.train_data) - 1) for x in range(self.batch_size)]
-            train_data = [self.train_data[x] for x in indexes]
-            indexes = [r.randint(0, len(self.test_data) - 1) for x in range(self.batch_size/2)]
-            test_data = [self.test_data[x] for x in indexes]
-        else:
-            train_data = self.train_data
-            test_data = self.test_data
+            return self.samplers["train"].next(), self.samplers["test"].next()
+        return None, None
 
-        # print "=>Evaluating training data..."
-        for pair in train_data:
-            inp = pair[0]
-            
-            # For normal sequence:
-            # target = [self.output_dict[x] for x in pair[1]]
-            
-            # For classification:
-            target = pair[1]
-
-            mapped = self.input_mapper.compute(inp)
-            structure = self.structure.make(mapped)
-            for i in range(len(structure)):
-                structure[i] = self.semantical_mapper.compute(structure[i])
-            filtered = self.attention.filter(structure)
-            outputs = self.type_computer.compute(filtered)
-            outputs = self.output_mapper.compute(outputs)
-
-            # For normal sequence:
-            # if len(outputs) >= len(target):
-            #         for i in range(len(outputs)):
-            #             if i < len(target):
-            #                 if outputs[i] != target[i]:
-            #                     error_local += 1
-            #             else:
-            #                 error_local += 1
-            # else:
-            #     for i in range(len(target)):
-            #         if i < len(outputs):
-            #             if outputs[i] != target[i]:
-            #                 error_local += 1
-            #         else:
-            #             error_local += 1
-
-            # error += error_local
-
-            # For classification:
-            if len(outputs) != 0:
-                output = int(outputs[-1])
-            else:
-                output = 0
+    def score(self, chromosome, train_indexes=None, test_indexes=None, report_test=True, threshold=None):
+        """Scores a chromosome on the given minibatches. Depends on nothing but its arguments and the dataset, so it can
+        run in any process.
 
-            if output != int(target):
-                error += 1
+        :param threshold: :type float: If given, scoring stops as soon as the train accuracy cannot reach it, see
+                                       race_batch().
+        :return: :type tuple: (train_acc, test_outputs, test_acc), the test results are None unless report_test and
+                              the chromosome was scored on the whole train minibatch.
+        """
+        if self.profile is not None:
+            start = time.time()
+        genes = self.decode(chromosome)
+        if self.profile is not None:
+            self.profile.add("decode", start)
+            self.profile.count("individuals", 1)
+        digests = self.layout.digests(genes) if self.stage_cache is not None or self.shared_stages is not None else None
 
-        # print "Train acc: " + str((len(train_data) - error)/len(train_data)) + " Train error: " + str(error)
+        train_batch = self.minibatch("train", train_indexes)
+        test_batch = self.minibatch("test", test_indexes)
+
+        # print "=>Evaluating training data..."
+        if threshold is None:
+            train_acc = self.evaluate_batch(train_batch, digests)[1]
+        else:
+            train_acc, finished = self.race_batch(train_batch, threshold, digests)
+            if not finished:
+                return train_acc, None, None
+
+        # print "Train acc: " + str(train_acc)
 
         # print "=>Evaluating testing data..."
         if report_test:
-            for pair in test_data:
-                inp = pair[0]
-                
-                # For normal sequence:
-                # target = [self.output_dict[x] for x in pair[1]]
-                
-                # For classification:
-                target = pair[1]
-
-                mapped = self.input_mapper.compute(inp)
-                structure = self.structure.make(mapped)
-                for i in range(len(structure)):
-                    structure[i] = self.semantical_mapper.compute(structure[i])
-                filtered = self.attention.filter(structure)
-                outputs = self.type_computer.compute(filtered)
-                outputs = self.output_mapper.compute(outputs)
-
-                # For normal sequence:
-                # if len(outputs) >= len(target):
-                #     for i in range(len(outputs)):
-                #         if i < len(target):
-                #             if outputs[i] != target[i]:
-                #                 test_error_local += 1
-                #         else:
-                #             test_error_local += 1
-                # else:
-                #     for i in range(len(target)):
-                #         if i < len(outputs):
-                #             if outputs[i] != target[i]:
-                #                 test_error_local += 1
-                #         else:
-                #             test_error_local += 1
-
-                # test_error += test_error_local/len(target)
-
-                # For classification:
-                if len(outputs) != 0:
-                    output = int(outputs[-1])
-                else:
-                    output = 0
-
-                print "Output: " + str(output)
-                print "Target: " + str(target)
-
-                if output != int(target):
-                    test_error += 1
-
-            if (len(test_data) - test_error)/len(test_data) > self.best_fit:
-                outfile = open(self.save_file, "wb")
-                cPickle.dump(list(chromosome), outfile)
-                outfile.close()
-
-            print "Test error acc.: " + str((len(test_data) - test_error)/len(test_data)) \
-                  # + " Num error: " + str(test_error)
-
-        return (len(train_data) - error)/len(train_data)
-
-    def evolve(self, n_generations):
+            test_outputs, test_acc = self.evaluate_batch(test_batch, digests)
+            return train_acc, test_outputs, test_acc
 
-        print "Initializing evolution..."
+        return train_acc, None, None
+
+    def test(self, chromosome, test_indexes=None):
+        """
+        :return: :type float: The accuracy of a chromosome on the given test minibatch.
+        """
+        genes = self.decode(chromosome)
+        digests = self.layout.digests(genes) if self.stage_cache is not None or self.shared_stages is not None else None
+        return self.evaluate_batch(self.minibatch("test", test_indexes), digests)[1]
+
+    def submit_test(self, chromosome, test_indexes=None):
+        """Tests a chromosome, in the background while evolving, see collect_tests()."""
+        task = (self.layout.as_array(chromosome).copy(), test_indexes)
+        if self.tester is not None:
+            self.tester.submit(task)
+        else:
+            self.report(task[0], self.test(*task))
+
+    def collect_tests(self, wait=False):
+        """Reports the chromosomes tested in the background since the last call.
 
-        # Genome instance
-        setOfAlleles = GAllele.GAlleles()
+        :param wait: :type bool: Whether to wait for those still being tested.
+        """
+        if self.tester is not None:
+            for task, test_acc in self.tester.results(wait):
+                self.report(task[0], test_acc)
+
+    def report(self, chromosome, test_acc):
+        """Saves a chromosome if its test accuracy is the best so far."""
+        self.tested.append(test_acc)
+        if test_acc > self.best_fit:
+            self.best_fit = test_acc
+            self.save(self.save_file, self.layout.as_array(chromosome).tolist())
+
+    def print_tests(self, ga):
+        """Prints the test accuracies collected since the last call. A step callback, never stops the evolution."""
+        self.collect_tests()
+        if self.tested:
+            print ("Test acc.: %d tested, max %.4f, mean %.4f, best %.4f" %
+                   (len(self.tested), max(self.tested), np.mean(self.tested), self.best_fit))
+            self.tested = []
+        return False
+
+    def save(self, path, obj):
+        """Writes obj to path atomically, on the checkpoint thread while evolving."""
+        if self.checkpointer is not None:
+            self.checkpointer.save(path, obj)
+        else:
+            checkpoint.write(path, obj)
 
-        # Alleles for input_mapper
-        for i in xrange(self.input_mapper.n_symbols):
-            a = GAllele.GAlleleRange(0, self.input_mapper.n_symbols)
-            setOfAlleles.add(a)
+    def checkpoint(self, ga, checkpoint_file, frequency):
+        """Saves the state of an evolution every frequency generations, see restore().
 
-        # Alleles for structure
-        for i in xrange(len(self.structure.r_map)):
-            a = GAllele.GAlleleRange(0, self.n_objects)
-            setOfAlleles.add(a)
+        :param ga: :type engine.GeneticAlgorithm: The evolution, with its current generation scored.
+        :return: :type bool: False, so it can be used as a step callback that never stops the evolution.
+        """
+        if ga.currentGeneration % frequency != 0:
+            return False
+
+        population = ga.getPopulation()
+        state = {"generation": ga.currentGeneration,
+                 "chromosomes": np.array([self.layout.as_array(individual) for individual in population]),
+                 "scores": [individual.score for individual in population],
+                 "random_state": r.getstate(),
+                 "best_fit": self.best_fit,
+                 "best_score": self.best_score,
+                 "functions": self.type_computer.functions.copy(),
+                 "train_data": self.train_data,
+                 "test_data": self.test_data,
+                 "samplers": copy.deepcopy(self.samplers)}
+        self.save(checkpoint_file, state)
+        return False
+
+    def restore(self, state, ga):
+        """Continues a saved evolution, see checkpoint(). The random function bank and data split are restored too,
+        as they are not part of the chromosome.
+
+        :param state: :type dict: A state saved by checkpoint().
+        :param ga: :type engine.GeneticAlgorithm: The evolution to continue, before it is started.
+        """
+        self.best_fit = state["best_fit"]
+        self.best_score = state.get("best_score", -1.0)
+        self.type_computer.set_functions(state["functions"])
+        self.train_data = state["train_data"]
+        self.test_data = state["test_data"]
+        self.splits = {}
+        self.batches = {}
+        self.samplers = state["samplers"]
+        r.setstate(state["random_state"])
+        ga.restore(state["generation"], state["chromosomes"].tolist(), state["scores"])
+
+    def fitness_key(self, task):
+        """
+        :param task: :type tuple: Arguments of score(), with the chromosome as a gene buffer.
+        :return: :type tuple: Fitness cache key of the task, from the genes and the minibatches they are scored on.
+        """
+        genes, train_indexes, test_indexes, report_test, threshold = task
+        return (hashlib.md5(genes).digest(),
+                hashlib.md5(np.asarray(train_indexes, dtype=np.intp)).digest() if train_indexes is not None else None,
+                hashlib.md5(np.asarray(test_indexes, dtype=np.intp)).digest() if test_indexes is not None else None,
+                report_test, threshold)
+
+    def score_group(self, tasks):
+        """Scores tasks one after the other, computing the semantically mapped structure of each minibatch chunk once
+        for all tasks whose chromosomes share the genes up to it. A single task is scored as by score(), its structure
+        streamed rather than kept.
+
+        :return: :type tuple: (results, hits), the result of score() for each task and the number of structures reused.
+        """
+        if len(tasks) == 1:
+            return [self.score(*tasks[0])], 0
+
+        self.shared_stages = {}
+        self.shared_hits = 0
+        try:
+            return [self.score(*task) for task in tasks], self.shared_hits
+        finally:
+            self.shared_stages = None
+
+    def run_tasks(self, tasks):
+        """Scores tasks grouped by the genes of their stages up to the semantically mapped structure, each group in one
+        process, see score_group(). The statistics of the groups are kept in group_stats.
+
+        :param tasks: :type list: Arguments of score(), with the chromosome as a gene buffer.
+        :return: :type list: The result of score() for each task.
+        """
+        groups = collections.OrderedDict()
+        for i, task in enumerate(tasks):
+            groups.setdefault(self.upstream_key(self.layout.digests(task[0])), []).append(i)
 
-        # Alleles for semantical_mapper
-        for i in xrange(len(self.semantical_mapper.map)):
-            a = GAllele.GAlleleRange(0, self.n_types)
-            setOfAlleles.add(a)
+        group_tasks = [[tasks[i] for i in members] for members in groups.values()]
+        if self.workers is not None:
+            outputs = self.workers.map_groups(group_tasks)
+        else:
+            outputs = [self.score_group(group) for group in group_tasks]
+
+        results = [None]*len(tasks)
+        self.group_stats = []
+        for (key, members), (group_results, hits) in zip(groups.items(), outputs):
+            for i, result in zip(members, group_results):
+                results[i] = result
+            self.group_stats.append((key, len(members), hits))
+        if self.profile is not None:
+            self.profile.count("groups", len(groups))
+            self.profile.count("shared", sum(hits for key, size, hits in self.group_stats))
+        return results
+
+    def score_tasks(self, tasks):
+        """Scores tasks, see run_tasks(). Tasks found in the fitness cache are not scored again, nor are repeats of a
+        task.
+
+        :param tasks: :type list: Arguments of score(), with the chromosome as a gene buffer.
+        :return: :type list: The result of score() for each task.
+        """
+        if self.fitness_cache is None:
+            return self.run_tasks(tasks)
+
+        keys = [self.fitness_key(task) for task in tasks]
+        found = {}
+        pending = []
+        for key, task in zip(keys, tasks):
+            if key in found:
+                continue
+            found[key] = self.fitness_cache.get(key)
+            if found[key] is None:
+                pending.append((key, task))
+
+        results = self.run_tasks([task for key, task in pending])
+        for (key, task), result in zip(pending, results):
+            found[key] = result
+            self.fitness_cache.put(key, result)
+
+        return [found[key] for key in keys]
 
-        # Alleles for attention
-        for i in xrange(self.max_attention_depth*self.max_attention_objects*2):
-            a = GAllele.GAlleleRange(0, self.n_types)
-            setOfAlleles.add(a)
+    def eval_func(self, chromosome, report_test=True):
+        return self.evaluate_population([chromosome], report_test)[0]
 
-        # Alleles for computer
-        for i in xrange(len(self.type_computer.path)*len(self.type_computer.path[0])):
-            a = GAllele.GAlleleRange(0, self.n_functions-1)
-            setOfAlleles.add(a)
+    def evaluate_population(self, individuals, report_test=True):
+        """Scores a generation, see score_tasks(). The whole generation is scored on the same minibatches, drawn here so
+        the scores do not depend on the number of workers.
 
-        # Alleles for output_mapper
-        for i in xrange(self.n_types + 1):
-            a = GAllele.GAlleleRange(0, self.output_mapper.n_symbols)
-            setOfAlleles.add(a)
+        :param individuals: :type list: The chromosomes to score.
+        :param report_test: :type bool: Whether chromosomes that beat the best train score so far are tested, see
+                                        submit_test().
+        :return: :type list: The train accuracy of each chromosome.
+        """
+        if self.halving is not None:
+            return self.evaluate_halving(individuals, report_test)
+
+        train_indexes, test_indexes = self.draw()
+        tasks = [(self.layout.as_array(individual), train_indexes, test_indexes, False, self.threshold)
+                 for individual in individuals]
+
+        results = self.score_tasks(tasks)
+
+        scores = []
+        for task, result in zip(tasks, results):
+            train_acc = result[0]
+            if report_test and len(self.test_data) and train_acc > self.best_score:
+                self.best_score = train_acc
+                self.submit_test(task[0], test_indexes)
+            scores.append(train_acc)
+        self.collect_tests()
+        return scores
+
+    def evaluate_halving(self, individuals, report_test=True):
+        """Scores a generation by successive halving. Every chromosome is scored on a random slice of the train split,
+        then the best 1/rate of them on a slice rate times larger, and so on up to the whole split. Slices are nested,
+        so each round only scores the samples the slice before did not hold. A chromosome's score is its accuracy on
+        the largest slice it was scored on, capped below the scores of the chromosomes that went on to a later round,
+        so a lucky score on a small slice never outranks one on a larger slice. Only chromosomes scored on the whole
+        split are tested.
+
+        :param individuals: :type list: The chromosomes to score.
+        :param report_test: :type bool: See evaluate_population().
+        :return: :type list: The train accuracy of each chromosome.
+        """
+        size, rate = self.halving
+        test_indexes = self.draw()[1]
+        order = np.random.RandomState(r.getrandbits(32)).permutation(len(self.train_data))
+        weights = self.dataset.weights[self.train_data[order]]
+
+        genes = [self.layout.as_array(individual) for individual in individuals]
+        correct = np.zeros(len(genes), dtype=np.int64)
+        scores = np.zeros(len(genes))
+        alive = np.arange(len(genes))
+        # Chromosomes dropped after each round
+        dropped = []
+        start = 0
+        stop = min(size, len(order))
+        while True:
+            indexes = np.sort(order[start:stop])
+            results = self.score_tasks([(genes[i], indexes, None, False, None) for i in alive])
+            total = weights[start:stop].sum()
+            correct[alive] += [int(round(result[0]*total)) for result in results]
+            scores[alive] = correct[alive].astype(float)/weights[:stop].sum()
+            if stop == len(order):
+                break
+
+            ranked = alive[np.argsort(-scores[alive], kind="mergesort")]
+            alive = ranked[:-(-len(ranked)//rate)]
+            dropped.append(ranked[len(alive):])
+            start = stop
+            stop = min(stop*rate, len(order))
+
+        # Ranks by the round reached first, then by score
+        reached = alive
+        for chromosomes in reversed(dropped):
+            floor = np.nextafter(scores[reached].min(), 0)
+            scores[chromosomes] = np.minimum(scores[chromosomes], floor)
+            reached = np.concatenate((reached, chromosomes))
+
+        if report_test and len(self.test_data):
+            for i in alive:
+                if scores[i] > self.best_score:
+                    self.best_score = scores[i]
+                    self.submit_test(genes[i], test_indexes)
+        self.collect_tests()
+        return scores.tolist()
+
+    def set_threshold(self, ga, rank):
+        """Sets the threshold of the next generation to the score of the individual ranked rank in the current one. A
+        step callback, never stops the evolution.
+
+        :param rank: :type int: 1 for the best individual, the population size for the worst.
+        """
+        scores = sorted((individual.score for individual in ga.getPopulation()), reverse=True)
+        self.threshold = scores[min(rank, len(scores)) - 1]
+        return False
+
+    def print_profile(self, ga):
+        """Prints and clears the profile of the generation just scored. A step callback, never stops the evolution."""
+        print self.profile.summary()
+        self.profile.clear()
+        return False
+
+    def evolve(self, n_generations, n_workers=1, checkpoint_file=None, checkpoint_frequency=10, profile=False,
+               migration=None, race=None, halving=None, halving_rate=2):
+        """
+        :param n_generations: :type int: Number of generations to evolve, counting those of a resumed evolution.
+        :param n_workers: :type int: Number of processes scoring each generation.
+        :param checkpoint_file: Path the state of the evolution is saved to. If it exists, the evolution resumes from
+                                it.
+        :param checkpoint_frequency: :type int: Number of generations between checkpoints.
+        :param profile: :type bool: Whether to print a profile of each generation, see profiler.Profile.
+        :param migration: :type pyevolve.Migration.MigrationScheme: Exchanges individuals with other populations, see
+                          islands.IslandMigration.
+        :param race: :type int: If given, an individual is scored only as long as it can still reach the score of the
+                                individual ranked race in the previous generation, e.g. the number of elites. An
+                                individual that cannot reach it is given the highest score it could still have
+                                reached, below it, and gets no test report.
+        :param halving: :type int: If given, generations are scored by successive halving, see evaluate_halving(),
+                                   starting on this many train samples. Racing does not apply then.
+        :param halving_rate: :type int: Factor by which the slice grows and the scored chromosomes shrink each round.
+        """
+        if halving is not None and (halving < 1 or halving_rate < 2):
+            raise ValueError("Successive halving needs halving >= 1 and halving_rate >= 2.")
 
-        genome = G1DList.G1DList(len(setOfAlleles))
-        genome.setParams(allele=setOfAlleles)
+        print "Initializing evolution..."
+
+        # Genome instance, genes in one array laid out as self.layout, each in the range of its segment
+        genome = ArrayGenome(self.layout)
 
         # The evaluator function (objective function)
         genome.evaluator.set(self.eval_func)
-        genome.mutator.set(Mutators.G1DListMutatorAllele)
-        genome.initializator.set(Initializators.G1DListInitializatorAllele)
 
-        # Genetic Algorithm Instance
-        ga = GSimpleGA.GSimpleGA(genome)
+        # Genetic Algorithm Instance, scoring whole generations at once
+        ga = GeneticAlgorithm(genome, self.evaluate_population)
         ga.minimax = Consts.minimaxType["maximize"]
         ga.selector.set(Selectors.GRankSelector)
         ga.setGenerations(n_generations)
+        if migration is not None:
+            ga.setMigrationAdapter(migration)
+
+        if checkpoint_file is not None:
+            state = checkpoint.load(checkpoint_file)
+            if state is not None:
+                print "Resuming from generation " + str(state["generation"]) + "..."
+                self.restore(state, ga)
+            ga.stepCallback.add(lambda engine: self.checkpoint(engine, checkpoint_file, checkpoint_frequency))
+
+        ga.stepCallback.add(self.print_tests)
+
+        if profile:
+            self.profile = Profile()
+            ga.stepCallback.add(self.print_profile)
+
+        if race is not None:
+            ga.stepCallback.add(lambda engine: self.set_threshold(engine, race))
+
+        if halving is not None:
+            self.halving = (halving, halving_rate)
+
+        if not self.stochastic:
+            # Gathered before forking, so workers share them
+            self.minibatch("train")
+            self.minibatch("test")
+        if n_workers > 1:
+            self.workers = PoolEvaluator(self, n_workers)
+        if len(self.test_data):
+            # Chromosomes are tested in the background, see submit_test()
+            self.tester = TestEvaluator(self)
 
         print "Evolving..."
 
         # Do the evolution, with stats dump
         # frequency of 1 generations
-        ga.evolve(freq_stats=1)
+        self.checkpointer = checkpoint.Checkpointer()
+        try:
+            ga.evolve(freq_stats=1)
+            self.collect_tests(wait=True)
+            self.print_tests(ga)
+            if checkpoint_file is not None:
+                self.checkpoint(ga, checkpoint_file, 1)
+            if profile:
+                self.print_profile(ga)
+        finally:
+            self.profile = None
+            self.threshold = None
+            self.halving = None
+            if self.workers is not None:
+                self.workers.close()
+                self.workers = None
+            if self.tester is not None:
+                self.tester.close()
+                self.tester = None
+            self.checkpointer.close()
+            self.checkpointer = None
+
+        if self.fitness_cache is not None:
+            print "Fitness cache hits: " + str(self.fitness_cache.hits) + ", misses: " + str(self.fitness_cache.misses)
 
         print ga.bestIndividual()
+
+    def evolve_islands(self, n_islands, n_generations, rate=10, n_migrants=2, topology="ring",
+                       transport_factory=islands.queue_transports, **evolve_args):
+        """Evolves n_islands populations, one process each, that exchange their best individuals. See islands.evolve().
+
+        :param rate: :type int: Number of generations between migrations.
+        :param n_migrants: :type int: Number of best individuals an island sends to each neighbour.
+        :param topology: "ring", "complete" or the list of islands each island sends to.
+        :param transport_factory: Builds the transports islands exchange individuals through, see islands.evolve().
+        :param evolve_args: Other arguments of evolve(), e.g. checkpoint_file, which gets one file per island.
+        """
+        return islands.evolve(self, n_islands, n_generations, rate, n_migrants, topology, transport_factory,
+                              **evolve_args)
@@ -1,11 +1,55 @@
 """Class defining a symbol structure.
 
     Use: Pass 1-d data (an iterable) to make() to create the structure,
-         then call get() to return the structure.
+         then call get() to return the structure. layers() computes the structure lazily, layer by layer, and can
+         stop at a given depth.
+
+    The pair map is held as a flat array, r_map, indexed by pair_index() of an unordered pair of objects. Gene i of
+    set() maps the pair index_pair(i), so genes go (0, 0), (0, 1), (1, 1), (0, 2), (1, 2), (2, 2), (0, 3), ...
 """
 
-import itertools
+import math
 import random as r
+import numpy as np
+from genome import dtype_for
+
+
+def pair_index(a, b):
+    """Triangular index of the unordered pair (a, b): max*(max + 1)/2 + min.
+
+    :param a: :type int or np.ndarray: Object(s) in range [0, n_objects].
+    :param b: :type int or np.ndarray: Object(s) in range [0, n_objects].
+    :return: The index of each pair in range [0, (n_objects + 1)*(n_objects + 2)/2).
+    """
+    lo = np.minimum(a, b).astype(np.intp)
+    hi = np.maximum(a, b).astype(np.intp)
+    return hi*(hi + 1)//2 + lo
+
+
+def index_pair(index):
+    """Inverse of pair_index().
+
+    :param index: :type int: A pair index.
+    :return: :type tuple: The pair (a, b) with a <= b.
+    """
+    b = int((math.sqrt(8*index + 1) - 1)//2)
+    while b*(b + 1)//2 > index:
+        b -= 1
+    while (b + 1)*(b + 2)//2 <= index:
+        b += 1
+    return index - b*(b + 1)//2, b
+
+
+def layers_batch(r_map, data, lengths, depth=None):
+    """Structure.layers_batch() for the pair map r_map."""
+    dim = np.asarray(data)
+    size = np.asarray(lengths)
+    k = 0
+    while (size > 1).any() and (depth is None or k < depth):
+        dim = r_map[pair_index(dim[:, :-2], dim[:, 1:-1])]
+        size = np.maximum(size - 2, 0)
+        k += 1
+        yield dim, size
 
 
 class Structure:
@@ -15,32 +59,54 @@ class Structure:
         :param n_objects: Number of symbols to map input data to in structure.
         :return:
         """
-        pairs = itertools.product([x for x in range(n_objects+1)], [x for x in range(n_objects+1)])
-        sets = {frozenset(x) for x in pairs}
-        self.r_map = {x: r.randint(0, n_objects) for x in sets}
+        self.n_objects = n_objects
+        n_pairs = (n_objects + 1)*(n_objects + 2)//2
+        random_state = np.random.RandomState(r.getrandbits(32))
+        self.r_map = random_state.randint(0, n_objects + 1, n_pairs).astype(dtype_for(n_objects))
 
     def make(self, data):
         """
         :param data: :type iterable: Data to be converted to structure. Must be 1-d.
-        :return: None
-        """
-        structure = []
-        dim = data
-        while len(dim) > 1:
-            dim_temp = []
-            for i in range(len(dim) - 2):
-                pair = frozenset([dim[i], dim[i + 1]])
-                dim_temp.append(self.r_map[pair])
-            dim = dim_temp
-            structure.append(dim_temp)
-        return structure
+        :return: :type list: The layers of the structure as arrays.
+        """
+        return list(self.layers(data))
+
+    def layers(self, data, depth=None):
+        """Lazy make(), each layer is computed when it is consumed.
+
+        :param data: :type iterable: Data to be converted to structure. Must be 1-d.
+        :param depth: :type int: Number of layers to compute at most, None for the whole structure.
+        :return: :type generator: The layers of the structure as arrays.
+        """
+        dim = np.asarray(data)
+        k = 0
+        while len(dim) > 1 and (depth is None or k < depth):
+            dim = self.r_map[pair_index(dim[:-2], dim[1:-1])]
+            k += 1
+            yield dim
+
+    def make_batch(self, data, lengths):
+        """Batched make(), layers of all samples are computed together.
+
+        :param data: :type np.ndarray: A 2-d array of padded samples, one per row.
+        :param lengths: :type np.ndarray: The length of each sample.
+        :return: :type list: (layer, sizes) pairs. layer is a 2-d array holding the layer of every sample in its first
+                             sizes[i] entries of row i. Samples with fewer layers have size 0.
+        """
+        return list(self.layers_batch(data, lengths))
+
+    def layers_batch(self, data, lengths, depth=None):
+        """Lazy make_batch(), each layer is computed when it is consumed.
+
+        :param depth: :type int: Number of layers to compute at most, None for the whole structures.
+        :return: :type generator: (layer, sizes) pairs as in make_batch().
+        """
+        return layers_batch(self.r_map, data, lengths, depth)
 
     def set(self, symbol_list):
         """
-        :param symbol_list: A list of size r_map defining the new mapping.
+        :param symbol_list: A list of size r_map defining the new mapping, in pair_index() order. Arrays are used
+                            without copying.
         :return:
         """
-        i = 0
-        for key, value in self.r_map.iteritems():
-            self.r_map[key] = symbol_list[i]
-            i += 1
+        self.r_map = np.asarray(symbol_list)
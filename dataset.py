@@ -0,0 +1,154 @@
+"""Integer-encoded datasets, stored as .npy files and memory-mapped when loaded.
+
+   Use: Convert a pickled dataset once with convert(), or from the command line:
+            python dataset.py data.pkl data_dir
+        then pass the directory to load(). Arrays of a loaded dataset are memory-mapped, so only the samples that are
+        gathered into a minibatch with take() are read. from_pickle() interns a pickled dataset in memory instead.
+
+   Each input is a string of symbols, interned as the position of each symbol in the sorted vocabulary. Identical
+   (input, target) samples are interned once, weighted by their number of occurrences, so accuracies weighted by
+   weights are those of the whole dataset. A dataset directory holds:
+        vocabulary.npy  The symbols, sorted.
+        values.npy      The codes of all inputs, concatenated.
+        offsets.npy     Input i is values[offsets[i]:offsets[i + 1]].
+        targets.npy     The integer target of each input.
+        weights.npy     The number of occurrences of each input with its target, ones if the file is missing.
+"""
+
+import cPickle
+import hashlib
+import os
+import sys
+import numpy as np
+from batch import Batch
+
+FILES = ("vocabulary", "values", "offsets", "targets", "weights")
+
+
+def load_pairs(datafile, sep_features_targets=False):
+    """
+    :param datafile: Path of a pickled list of rows, each holding the target at index 1 and the symbols of the input,
+                     one character each, from index 2 on.
+    :return: :type list: (input, target) pairs of strings, the input being the symbols of its row joined.
+    """
+    df = open(datafile, "rb")
+    data = cPickle.load(df)
+    df.close()
+
+    features = []
+    for i in range(len(data)):
+        symbols = [str(symbol) for symbol in data[i][2:]]
+        features.append("".join(symbols))
+        if len(features[-1]) != len(symbols):
+            raise ValueError("Row %d holds symbols longer than one character." % i)
+    targets = [str(data[i][1]) for i in range(len(data))]
+
+    pairs = zip(features, targets)
+
+    if sep_features_targets:
+        pairs = zip(pairs[0], pairs[1])
+
+    return pairs
+
+
+def intern(pairs):
+    """
+    :param pairs: :type list: (input, target) pairs, inputs are strings and targets integers.
+    :return: :type Dataset: The interned dataset, in memory, each distinct pair once in order of first occurrence.
+    """
+    positions = {}
+    weights = []
+    unique = []
+    for pair in pairs:
+        pair = (pair[0], int(pair[1]))
+        if pair in positions:
+            weights[positions[pair]] += 1
+        else:
+            positions[pair] = len(unique)
+            unique.append(pair)
+            weights.append(1)
+    pairs = unique
+
+    inputs = [np.frombuffer(pair[0], dtype=np.uint8) for pair in pairs]
+    used = np.zeros(256, dtype=bool)
+    for x in inputs:
+        used[x] = True
+    vocabulary = np.array([chr(x) for x in np.flatnonzero(used)], dtype="S1")
+
+    codes = np.cumsum(used, dtype=np.intp) - 1
+    offsets = np.zeros(len(inputs) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(x) for x in inputs])
+    values = codes[np.concatenate(inputs)].astype(np.uint8) if inputs else np.zeros(0, dtype=np.uint8)
+    targets = np.array([pair[1] for pair in pairs], dtype=np.int64)
+
+    return Dataset(vocabulary, values, offsets, targets, np.array(weights, dtype=np.int64))
+
+
+def from_pickle(datafile, sep_features_targets=False):
+    return intern(load_pairs(datafile, sep_features_targets))
+
+
+def convert(datafile, path, sep_features_targets=False):
+    """Interns a pickled dataset and writes it to the directory path."""
+    dataset = from_pickle(datafile, sep_features_targets)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    for name in FILES:
+        np.save(os.path.join(path, name + ".npy"), getattr(dataset, name))
+
+
+def load(path, mmap_mode="r"):
+    """
+    :param path: A directory written by convert().
+    :param mmap_mode: Passed to np.load(), None reads the arrays into memory.
+    :return: :type Dataset: The dataset.
+    """
+    arrays = [np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode)
+              for name in FILES if os.path.exists(os.path.join(path, name + ".npy"))]
+    return Dataset(*arrays)
+
+
+class Dataset:
+
+    def __init__(self, vocabulary, values, offsets, targets, weights=None):
+        """
+        :param weights: :type np.ndarray: The number of occurrences of each sample, None if every sample occurs once.
+        """
+        self.vocabulary = vocabulary
+        self.values = values
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights if weights is not None else np.ones(len(targets), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.targets)
+
+    def input(self, i):
+        """
+        :return: :type str: Input i as a string.
+        """
+        return "".join(self.vocabulary[self.values[self.offsets[i]:self.offsets[i + 1]]])
+
+    def take(self, indexes):
+        """Gathers inputs into a padded batch, reading only their values.
+
+        :param indexes: :type np.ndarray: The inputs to gather, may repeat.
+        :return: :type batch.Batch: The inputs with their targets and weights, keyed by indexes.
+        """
+        indexes = np.asarray(indexes, dtype=np.intp)
+        starts = np.asarray(self.offsets[indexes], dtype=np.intp)
+        lengths = np.asarray(self.offsets[indexes + 1], dtype=np.intp) - starts
+
+        # Row and column of every value gathered
+        rows = np.repeat(np.arange(len(indexes)), lengths)
+        columns = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+        samples = np.zeros((len(indexes), lengths.max() if len(indexes) else 0), dtype=self.values.dtype)
+        samples[rows, columns] = self.values[starts[rows] + columns]
+        targets = np.asarray(self.targets[indexes], dtype=np.intp)
+        weights = np.asarray(self.weights[indexes], dtype=np.int64)
+        return Batch(samples, lengths, targets, hashlib.md5(indexes).digest(), weights)
+
+
+if __name__ == "__main__":
+    convert(sys.argv[1], sys.argv[2])
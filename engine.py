@@ -0,0 +1,135 @@
+"""Genetic algorithm engine that evaluates a whole generation at once.
+
+   Use: Same as pyevolve's GSimpleGA, but pass a population evaluator to the initializer. The evaluator is called with
+        the list of individuals of each generation and returns their scores, so it can batch or parallelise work across
+        the generation instead of scoring one individual after another.
+        Call restore() before evolve() to continue from a saved generation instead of a random population.
+"""
+
+import random
+from pyevolve import GPopulation
+from pyevolve import GSimpleGA
+from pyevolve import Consts
+from pyevolve import Util
+
+
+class Population(GPopulation.GPopulation):
+
+    def __init__(self, genome, evaluator=None):
+        """
+        :param genome: The sample genome, or a population to clone.
+        :param evaluator: :type callable: Takes a list of individuals and returns a list of their scores. Taken from
+                                          genome when cloning a Population.
+        """
+        GPopulation.GPopulation.__init__(self, genome)
+        if evaluator is None and isinstance(genome, Population):
+            evaluator = genome.evaluator
+        self.evaluator = evaluator
+        # Set when the individuals were restored with their scores, see GeneticAlgorithm.restore()
+        self.restored = False
+
+    def evaluate(self, **args):
+        if self.restored:
+            self.restored = False
+        else:
+            scores = self.evaluator(self.internalPop)
+            for individual, score in zip(self.internalPop, scores):
+                individual.score = score
+        self.clearFlags()
+
+
+class GeneticAlgorithm(GSimpleGA.GSimpleGA):
+
+    def __init__(self, genome, evaluator, seed=None, interactiveMode=True):
+        """
+        :param genome: The sample genome.
+        :param evaluator: :type callable: The population evaluator, see Population.
+        """
+        GSimpleGA.GSimpleGA.__init__(self, genome, seed, interactiveMode)
+        self.internalPop = Population(self.internalPop, evaluator)
+        self.saved = None
+
+    def restore(self, generation, chromosomes, scores):
+        """Makes evolve() start from a saved generation. The saved scores are used, not recomputed.
+
+        :param generation: :type int: The number of the saved generation.
+        :param chromosomes: :type list: The gene list of each individual.
+        :param scores: :type list: The raw score of each individual.
+        """
+        self.saved = (generation, chromosomes, scores)
+
+    def initialize(self):
+        if self.saved is None:
+            GSimpleGA.GSimpleGA.initialize(self)
+            return
+
+        generation, chromosomes, scores = self.saved
+        self.saved = None
+        self.setPopulationSize(len(chromosomes))
+        self.internalPop.create(minimax=self.minimax)
+        for individual, chromosome, score in zip(self.internalPop, chromosomes, scores):
+            individual.setInternalList(list(chromosome))
+            individual.score = score
+        self.internalPop.restored = True
+        self.currentGeneration = generation
+
+    def step(self):
+        """Does one generation. Same as GSimpleGA.step(), except the new population is a Population."""
+        new_pop = Population(self.internalPop)
+
+        size_iterate = len(self.internalPop)
+
+        # Odd population size
+        if size_iterate % 2 != 0:
+            size_iterate -= 1
+
+        crossover_empty = self.select(popID=self.currentGeneration).crossover.isEmpty()
+
+        for i in xrange(0, size_iterate, 2):
+            mom = self.select(popID=self.currentGeneration)
+            dad = self.select(popID=self.currentGeneration)
+
+            if not crossover_empty and (self.pCrossover >= 1.0 or Util.randomFlipCoin(self.pCrossover)):
+                for it in mom.crossover.applyFunctions(mom=mom, dad=dad, count=2):
+                    (sister, brother) = it
+            else:
+                sister = mom.clone()
+                brother = dad.clone()
+
+            sister.mutate(pmut=self.pMutation, ga_engine=self)
+            brother.mutate(pmut=self.pMutation, ga_engine=self)
+
+            new_pop.internalPop.append(sister)
+            new_pop.internalPop.append(brother)
+
+        if len(self.internalPop) % 2 != 0:
+            mom = self.select(popID=self.currentGeneration)
+            dad = self.select(popID=self.currentGeneration)
+
+            if Util.randomFlipCoin(self.pCrossover):
+                for it in mom.crossover.applyFunctions(mom=mom, dad=dad, count=1):
+                    (sister, brother) = it
+            else:
+                sister = random.choice([mom, dad])
+                sister = sister.clone()
+                sister.mutate(pmut=self.pMutation, ga_engine=self)
+
+            new_pop.internalPop.append(sister)
+
+        new_pop.evaluate()
+
+        if self.elitism:
+            for i in xrange(self.nElitismReplacement):
+                old_score = self.internalPop.bestRaw(i).score
+                new_score = new_pop.bestRaw(i).score
+                if self.getMinimax() == Consts.minimaxType["maximize"] and old_score > new_score or \
+                   self.getMinimax() == Consts.minimaxType["minimize"] and old_score < new_score:
+                    new_pop[len(new_pop) - 1 - i] = self.internalPop.bestRaw(i)
+
+        self.internalPop = new_pop
+        self.internalPop.sort()
+
+        self.currentGeneration += 1
+
+        # Past nGenerations when restored from a longer evolution
+        return self.currentGeneration >= self.nGenerations
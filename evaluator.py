@@ -0,0 +1,110 @@
+"""Scores individuals of a Constructor in worker processes.
+
+   Use: Initialize with a Constructor and the number of workers, after the Constructor has loaded its data. Workers
+        are forked, so each holds its own copy of the layers and shares the read-only dataset with the parent. Call
+        map_groups() with groups of score tasks that share stages, see Constructor.score_group(). Call close() when
+        done. If the Constructor is profiling, the profiles of the tasks are added to its profile.
+
+        TestEvaluator tests chromosomes on the test set in one background process the same way, so the generation
+        goes on while they are tested. Call submit() for each chromosome and results() for those that are done.
+"""
+
+import multiprocessing
+
+# The Constructor scored by the workers, inherited through fork
+_constructor = None
+
+
+def _score_group(tasks):
+    if _constructor.profile is None:
+        return _constructor.score_group(tasks), None
+
+    _constructor.profile.clear()
+    result = _constructor.score_group(tasks)
+    return result, _constructor.profile.state()
+
+
+def _test(task):
+    # Test time is not part of the profile of a generation
+    _constructor.profile = None
+    return _constructor.test(*task)
+
+
+class PoolEvaluator:
+
+    def __init__(self, constructor, n_workers):
+        """
+        :param constructor: :type Constructor: The constructor to score individuals with.
+        :param n_workers: :type int: The number of worker processes.
+        """
+        global _constructor
+        _constructor = constructor
+        self.constructor = constructor
+        self.n_workers = n_workers
+        self.pool = multiprocessing.Pool(n_workers)
+
+    def map_groups(self, groups):
+        """
+        :param groups: :type list: Lists of argument tuples for Constructor.score().
+        :return: :type list: The result of Constructor.score_group() for each group, in order.
+        """
+        # A group larger than a fair share of the tasks is split, so a converged population still keeps every worker
+        # busy. Each part computes the shared stages once.
+        size = max(1, -(-sum(len(group) for group in groups)//self.n_workers))
+        parts = [(i, group[start:start + size]) for i, group in enumerate(groups)
+                 for start in xrange(0, len(group), size)]
+
+        # Parts differ in size, so they are handed out one at a time
+        outputs = self.merge(self.pool.map(_score_group, [part for i, part in parts], chunksize=1))
+        results = [([], 0) for group in groups]
+        for (i, part), (part_results, hits) in zip(parts, outputs):
+            results[i] = (results[i][0] + part_results, results[i][1] + hits)
+        return results
+
+    def merge(self, results):
+        """Adds the profiles of results to the one of the constructor.
+
+        :return: :type list: The results without their profiles.
+        """
+        for result, profile in results:
+            if profile is not None:
+                self.constructor.profile.merge(profile)
+        return [result for result, profile in results]
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+class TestEvaluator:
+
+    def __init__(self, constructor):
+        """
+        :param constructor: :type Constructor: The constructor to test chromosomes with.
+        """
+        global _constructor
+        _constructor = constructor
+        self.pool = multiprocessing.Pool(1)
+        # (task, async result) of each submitted chromosome not returned by results() yet
+        self.pending = []
+
+    def submit(self, task):
+        """
+        :param task: :type tuple: Arguments of Constructor.test().
+        """
+        self.pending.append((task, self.pool.apply_async(_test, (task,))))
+
+    def results(self, wait=False):
+        """
+        :param wait: :type bool: Whether to wait for every submitted chromosome.
+        :return: :type list: (task, test accuracy) of the chromosomes tested since the last call, in submission order.
+        """
+        done = []
+        while self.pending and (wait or self.pending[0][1].ready()):
+            task, result = self.pending.pop(0)
+            done.append((task, result.get()))
+        return done
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
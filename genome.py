@@ -0,0 +1,183 @@
+"""Describes how a chromosome is laid out across the layers of a Constructor.
+
+   Use: Initialize with a list of (name, size, high) segments in chromosome order. Pass a chromosome to as_array() to
+        get it as one contiguous gene buffer, then pass the buffer to split() to get a zero-copy view per segment.
+        digests() fingerprints each segment, so genomes can be compared segment by segment, e.g. a mutated child with
+        its parent.
+
+        ArrayGenome is a pyevolve genome holding its genes in one such buffer, for use in place of a G1DList. Its
+        initializator, mutator and crossover draw every gene in the range of its segment, all genes at once.
+"""
+
+import hashlib
+import random
+import numpy as np
+from pyevolve import GenomeBase
+
+
+def dtype_for(high):
+    """
+    :param high: :type int: The largest value that has to be stored.
+    :return: The smallest unsigned integer dtype that can hold high.
+    """
+    if high < 2**16:
+        return np.uint16
+    return np.uint32
+
+
+class Layout:
+
+    def __init__(self, segments):
+        """
+        :param segments: :type list: (name, size, high) tuples in chromosome order. Genes of a segment are ints in the
+                                     range [0, high].
+        """
+        self.names = [name for name, size, high in segments]
+        self.sizes = dict((name, size) for name, size, high in segments)
+        self.highs = dict((name, high) for name, size, high in segments)
+        self.offsets = {}
+
+        index = 0
+        for name, size, high in segments:
+            self.offsets[name] = index
+            index += size
+        self.size = index
+        self.dtype = dtype_for(max(self.highs.values()))
+
+        # Largest value of each gene
+        self.high = np.repeat([high for name, size, high in segments], [size for name, size, high in segments])
+
+    def __len__(self):
+        return self.size
+
+    def as_array(self, chromosome):
+        """
+        :param chromosome: A gene buffer, a pyevolve genome (G1DList or ArrayGenome) or any sequence of ints of size
+                           len(self).
+        :return: :type np.ndarray: The genes as one contiguous array. Gene buffers of the right dtype are not copied.
+        """
+        if hasattr(chromosome, "getInternalList"):
+            chromosome = chromosome.getInternalList()
+        genes = np.asarray(chromosome, dtype=self.dtype)
+        if len(genes) != self.size:
+            raise ValueError("Chromosome has %d genes, layout expects %d." % (len(genes), self.size))
+        return genes
+
+    def split(self, genes):
+        """
+        :param genes: :type np.ndarray: A gene buffer as returned by as_array().
+        :return: :type dict: A view into genes for every segment, keyed by segment name.
+        """
+        return dict((name, genes[self.offsets[name]:self.offsets[name] + self.sizes[name]]) for name in self.names)
+
+    def digests(self, genes):
+        """
+        :param genes: :type np.ndarray: A gene buffer as returned by as_array().
+        :return: :type dict: A digest of the genes of every segment, keyed by segment name.
+        """
+        return dict((name, hashlib.md5(segment).digest()) for name, segment in self.split(genes).items())
+
+
+def _random_state():
+    # Drawn from the random module, so genomes follow its seed and state
+    return np.random.RandomState(random.getrandbits(32))
+
+
+def _random_genes(layout, random_state, positions=None):
+    """
+    :return: :type np.ndarray: Random values for the genes at positions, all genes if None.
+    """
+    high = layout.high if positions is None else layout.high[positions]
+    return (random_state.random_sample(len(high))*(high + 1)).astype(layout.dtype)
+
+
+def initialize(genome, **args):
+    """Initializator of ArrayGenome, draws every gene uniformly in its range."""
+    genome.genes = _random_genes(genome.layout, _random_state())
+
+
+def mutate(genome, **args):
+    """Mutator of ArrayGenome, redraws each gene in its range with probability pmut, like G1DListMutatorAllele.
+
+    :return: :type int: The number of genes redrawn.
+    """
+    if args["pmut"] <= 0.0:
+        return 0
+    random_state = _random_state()
+    # As many draws as flipping a coin per gene, without drawing a coin per gene
+    n_mutations = random_state.binomial(len(genome.genes), args["pmut"])
+    positions = np.unique(random_state.randint(0, len(genome.genes), n_mutations))
+    genome.genes[positions] = _random_genes(genome.layout, random_state, positions)
+    return len(positions)
+
+
+def crossover(genome, **args):
+    """Crossover of ArrayGenome, single point like G1DListCrossoverSinglePoint."""
+    mom = args["mom"]
+    dad = args["dad"]
+    cut = _random_state().randint(1, len(mom))
+
+    sister = None
+    brother = None
+    if args["count"] >= 1:
+        sister = mom.clone()
+        sister.resetStats()
+        sister.genes[cut:] = dad.genes[cut:]
+    if args["count"] == 2:
+        brother = dad.clone()
+        brother.resetStats()
+        brother.genes[cut:] = mom.genes[cut:]
+    return sister, brother
+
+
+class ArrayGenome(GenomeBase.GenomeBase):
+
+    def __init__(self, layout, cloning=False):
+        """
+        :param layout: :type Layout: The layout of the genes, gives their number, dtype and ranges.
+        """
+        GenomeBase.GenomeBase.__init__(self)
+        self.layout = layout
+        self.genes = np.zeros(layout.size, dtype=layout.dtype)
+        if not cloning:
+            self.initializator.set(initialize)
+            self.mutator.set(mutate)
+            self.crossover.set(crossover)
+
+    def __len__(self):
+        return len(self.genes)
+
+    def __getitem__(self, key):
+        return self.genes[key]
+
+    def __setitem__(self, key, value):
+        self.genes[key] = value
+
+    def __iter__(self):
+        return iter(self.genes)
+
+    def __eq__(self, other):
+        return np.array_equal(self.genes, other.genes)
+
+    def __repr__(self):
+        ret = GenomeBase.GenomeBase.__repr__(self)
+        ret += "- ArrayGenome\n"
+        ret += "\tSize:\t\t %d\n" % (len(self.genes),)
+        ret += "\tGenes:\t\t %s\n\n" % (self.genes,)
+        return ret
+
+    def getInternalList(self):
+        return self.genes
+
+    def setInternalList(self, genes):
+        self.genes = np.array(genes, dtype=self.layout.dtype)
+
+    def copy(self, g):
+        GenomeBase.GenomeBase.copy(self, g)
+        g.layout = self.layout
+        g.genes = self.genes.copy()
+
+    def clone(self):
+        newcopy = ArrayGenome(self.layout, True)
+        self.copy(newcopy)
+        return newcopy
@@ -0,0 +1,210 @@
+"""Island model: several populations evolving in separate processes, exchanging their elites.
+
+   Use: Call evolve() with a Constructor, or Constructor.evolve_islands(). Each island is a forked process running
+        evolve_island(), that is Constructor.evolve() on its own population, with its own random seed, save file and
+        checkpoint file. Every rate generations an island sends copies of its best individuals to its neighbours in
+        the topology, and replaces its worst individuals with the migrants that have reached it. Islands never wait
+        for each other, migrants that arrive late are taken at the next migration.
+
+        Islands talk through a transport with three methods: send(island, message) delivers a message to the inbox of
+        an island, receive() returns the messages in the inbox of this island without blocking and close() discards
+        what is left to send when the island is done. evolve() runs every island on this host, with the transports
+        of a factory, by default queue_transports(), whose QueueTransports connect islands through pipes. To spread
+        islands over several hosts, each host calls evolve_island() for its own islands with a transport over sockets.
+        Every host must build its Constructor from the same seed, so the layers that are not part of the chromosome
+        match, and give each island its own seed.
+"""
+
+import multiprocessing
+import Queue
+import random as r
+from pyevolve import Migration
+import checkpoint
+
+# Seconds between checks that the islands still running are alive
+POLL_INTERVAL = 1
+
+
+def topology(name, n_islands):
+    """
+    :param name: "ring", each island sends to the next, or "complete", each island sends to all others. A list
+                 holding the islands each island sends to is returned as is.
+    :param n_islands: :type int: Number of islands.
+    :return: :type list: The islands each island sends to.
+    """
+    if not isinstance(name, str):
+        return name
+    if name == "ring":
+        return [[(i + 1) % n_islands] if n_islands > 1 else [] for i in xrange(n_islands)]
+    if name == "complete":
+        return [[j for j in xrange(n_islands) if j != i] for i in xrange(n_islands)]
+    raise ValueError("Unknown topology " + name)
+
+
+class QueueTransport:
+
+    def __init__(self, inboxes, island):
+        """
+        :param inboxes: :type list: A multiprocessing.Queue per island, shared by all islands.
+        :param island: :type int: The island this endpoint receives for.
+        """
+        self.inboxes = inboxes
+        self.island = island
+
+    def send(self, island, message):
+        self.inboxes[island].put(message)
+
+    def receive(self):
+        messages = []
+        while True:
+            try:
+                messages.append(self.inboxes[self.island].get_nowait())
+            except Queue.Empty:
+                return messages
+
+    def close(self):
+        # Messages nobody will read must not keep the process from exiting
+        for inbox in self.inboxes:
+            inbox.cancel_join_thread()
+
+
+def queue_transports(n_islands):
+    """
+    :param n_islands: :type int: Number of islands.
+    :return: :type list: A QueueTransport per island, sharing one inbox per island.
+    """
+    inboxes = [multiprocessing.Queue() for i in xrange(n_islands)]
+    return [QueueTransport(inboxes, i) for i in xrange(n_islands)]
+
+
+class IslandMigration(Migration.MigrationScheme):
+
+    def __init__(self, transport, island, neighbours, rate, n_migrants):
+        """
+        :param transport: The transport of this island, see QueueTransport.
+        :param island: :type int: This island.
+        :param neighbours: :type list: The islands migrants are sent to.
+        :param rate: :type int: Number of generations between migrations.
+        :param n_migrants: :type int: Number of best individuals sent to each neighbour.
+        """
+        Migration.MigrationScheme.__init__(self, None, None, "islands")
+        self.transport = transport
+        self.island = island
+        self.neighbours = neighbours
+        self.setMigrationRate(rate)
+        self.setNumIndividuals(n_migrants)
+
+    def isReady(self):
+        generation = self.GAEngine.getCurrentGeneration()
+        return generation > 0 and generation % self.getMigrationRate() == 0
+
+    def exchange(self):
+        if not self.isReady():
+            return
+
+        population = self.GAEngine.getPopulation()
+        population.sort()
+        migrants = [(population.bestRaw(i).getInternalList().copy(), population.bestRaw(i).score)
+                    for i in xrange(min(self.getNumIndividuals(), len(population)))]
+        for island in self.neighbours:
+            self.transport.send(island, (self.island, migrants))
+
+        # The worst individuals are replaced, at most half of the population
+        received = [migrant for source, migrants in self.transport.receive() for migrant in migrants]
+        received = sorted(received, key=lambda migrant: migrant[1], reverse=True)[:len(population)//2]
+        for i, (genes, score) in enumerate(received):
+            individual = population.bestRaw(0).clone()
+            individual.setInternalList(genes)
+            individual.score = score
+            population[len(population) - 1 - i] = individual
+
+
+def evolve_island(constructor, island, transport, neighbours, seed, n_generations, rate=10, n_migrants=2,
+                  **evolve_args):
+    """Evolves one island in this process, exchanging migrants through transport. The save file of the constructor
+    and the checkpoint file are suffixed with the island number.
+
+    :param constructor: :type Constructor: The constructor, its save file becomes the one of the island.
+    :param island: :type int: This island.
+    :param transport: The transport of this island, see QueueTransport.
+    :param neighbours: :type list: The islands migrants are sent to, see topology().
+    :param seed: :type int: Seed of the random generator of the island.
+    :param rate: :type int: Number of generations between migrations.
+    :param n_migrants: :type int: Number of best individuals sent to each neighbour.
+    :param evolve_args: Other arguments of Constructor.evolve().
+    :return: :type float: The best test accuracy of the island.
+    """
+    r.seed(seed)
+    migration = IslandMigration(transport, island, neighbours, rate, n_migrants)
+    constructor.save_file = "%s.island%d" % (constructor.save_file, island)
+    if evolve_args.get("checkpoint_file") is not None:
+        evolve_args["checkpoint_file"] = "%s.island%d" % (evolve_args["checkpoint_file"], island)
+    try:
+        constructor.evolve(n_generations, migration=migration, **evolve_args)
+    finally:
+        transport.close()
+    return constructor.best_fit
+
+
+def _island(results, constructor, island, *args, **evolve_args):
+    try:
+        evolve_island(constructor, island, *args, **evolve_args)
+    finally:
+        results.put((island, constructor.best_fit, constructor.save_file))
+
+
+def evolve(constructor, n_islands, n_generations, rate=10, n_migrants=2, topology_name="ring",
+           transport_factory=queue_transports, **evolve_args):
+    """Evolves n_islands populations in parallel. The best chromosome found on any island, by test accuracy, is
+    saved to the save file of the constructor. An island that dies without reporting, e.g. killed, is left out.
+
+    :param constructor: :type Constructor: The constructor, forked into every island.
+    :param rate: :type int: Number of generations between migrations.
+    :param n_migrants: :type int: Number of best individuals an island sends to each neighbour.
+    :param topology_name: See topology().
+    :param transport_factory: Called with n_islands before the islands start, returns the transport of each island,
+                              see queue_transports().
+    :param evolve_args: Other arguments of Constructor.evolve(). Files are suffixed with the island number.
+    :return: :type float: The best test accuracy of all islands.
+    """
+    neighbours = topology(topology_name, n_islands)
+    transports = transport_factory(n_islands)
+    results = multiprocessing.Queue()
+
+    islands = [multiprocessing.Process(target=_island,
+                                       args=(results, constructor, i, transports[i], neighbours[i], r.getrandbits(32),
+                                             n_generations, rate, n_migrants),
+                                       kwargs=dict(evolve_args))
+               for i in xrange(n_islands)]
+    for island in islands:
+        island.start()
+    try:
+        finished = []
+        running = set(xrange(n_islands))
+        # Islands found dead at the last check, dropped if their result has not arrived by the next one
+        dead = set()
+        while running:
+            try:
+                result = results.get(timeout=POLL_INTERVAL)
+            except Queue.Empty:
+                for island in dead & running:
+                    print "Island %d died without reporting, exit code %s." % (island, islands[island].exitcode)
+                    running.discard(island)
+                dead = set(island for island in running if not islands[island].is_alive())
+                continue
+            finished.append(result)
+            running.discard(result[0])
+    finally:
+        for island in islands:
+            island.join(1)
+            if island.is_alive():
+                island.terminate()
+
+    if not finished:
+        raise RuntimeError("No island finished.")
+    island, best_fit, save_file = max(finished, key=lambda result: result[1])
+    best = checkpoint.load(save_file)
+    if best is not None:
+        checkpoint.write(constructor.save_file, best)
+    constructor.best_fit = max(constructor.best_fit, best_fit)
+    return best_fit
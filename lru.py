@@ -0,0 +1,75 @@
+"""Least recently used cache bounded by the memory its entries take.
+
+   Use: Initialize with the maximum number of bytes to hold. get() returns None on a miss, put() evicts the least
+        recently used entries until the new entry fits. hits and misses count the lookups made with get().
+
+   An entry counts its key, its value and ENTRY_OVERHEAD, so caches of many small entries, like the fitness cache,
+   stay within their bound too.
+"""
+
+import collections
+import sys
+import numpy as np
+
+# Bytes the bookkeeping of an entry takes: its slots in the dicts of the OrderedDict, its link in the order list and
+# the (value, size) pair it is stored as. Measured on CPython 2.7, 64-bit.
+ENTRY_OVERHEAD = 320
+
+# Bytes of an array object without its data
+ARRAY_OVERHEAD = sys.getsizeof(np.empty(0))
+
+
+def nbytes(value):
+    """
+    :param value: An array, a number, a string or a (nested) tuple or list of them.
+    :return: :type int: Approximate memory taken by value, containers included.
+    """
+    if isinstance(value, np.ndarray):
+        return ARRAY_OVERHEAD + value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(nbytes(x) for x in value)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+
+    def __init__(self, max_bytes):
+        """
+        :param max_bytes: :type int: Memory the entries may take in total. Entries larger than this are not cached.
+        """
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries[key] = entry
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value):
+        size = nbytes(key) + nbytes(value) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= old[1]
+        while self.size + size > self.max_bytes:
+            self.size -= self.entries.popitem(last=False)[1][1]
+        self.entries[key] = (value, size)
+        self.size += size
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
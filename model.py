@@ -0,0 +1,164 @@
+"""Compiled models, to classify inputs without a Constructor or its training data.
+
+   Use: Decode the chromosome to serve into a Constructor, e.g. with set(), and pass it to export() to write a model
+        file. Model.load() memory-maps the file, so a model loads in milliseconds whatever its size, then predict_batch()
+        classifies a list of inputs. From the command line:
+            python model.py model_file < inputs
+        prints the output of each line of inputs.
+
+   A model file holds the lookup tables of every layer, with the path of the TypeComputer compiled for every input
+   position. It starts with MAGIC, the format version and the length of a JSON header as two little-endian uint32s,
+   then the header. The header holds the sizes of the layers and, for each array, its dtype, shape and offset from the
+   first ALIGN-aligned position after the header. Arrays are stored in C order.
+"""
+
+import json
+import struct
+import sys
+import numpy as np
+from create_structure import layers_batch
+from attention import filter_batch
+from type_computer import compiled_last
+
+MAGIC = "RFMMODEL"
+VERSION = 1
+ALIGN = 64
+
+
+def _aligned(n):
+    return (n + ALIGN - 1)//ALIGN*ALIGN
+
+
+def export(constructor, path):
+    """Writes the layers of a constructor, as currently set, to a model file.
+
+    :param constructor: :type Constructor: The constructor, with the chromosome to serve decoded.
+    :param path: :type str: The model file.
+    """
+    type_computer = constructor.type_computer
+    type_computer.compile(type_computer.max_input)
+
+    arrays = [("vocabulary", np.frombuffer("".join(constructor.input_mapper.symbol_set), dtype=np.uint8)),
+              ("input_map", constructor.input_mapper.map),
+              ("r_map", constructor.structure.r_map),
+              ("semantical_map", constructor.semantical_mapper.map),
+              ("attention_table", constructor.attention.table),
+              ("attention_first", constructor.attention.first.astype(np.int32)),
+              ("attention_second", constructor.attention.second.astype(np.int32)),
+              ("last_layer", type_computer.last_layer.astype(np.int32)),
+              ("last_symbol", type_computer.last_symbol.astype(np.int32)),
+              ("output_map", constructor.output_mapper.map)]
+    arrays = [(name, np.ascontiguousarray(array)) for name, array in arrays]
+
+    header = {"n_objects": constructor.n_objects, "n_types": constructor.n_types,
+              "max_input": type_computer.max_input, "arrays": {}}
+    offset = 0
+    for name, array in arrays:
+        header["arrays"][name] = [array.dtype.str, list(array.shape), offset]
+        offset = _aligned(offset + array.nbytes)
+    header = json.dumps(header, sort_keys=True)
+
+    outfile = open(path, "wb")
+    outfile.write(MAGIC + struct.pack("<II", VERSION, len(header)) + header)
+    for name, array in arrays:
+        outfile.write("\0"*(_aligned(outfile.tell()) - outfile.tell()))
+        outfile.write(array.tostring())
+    outfile.close()
+
+
+class Model:
+
+    def __init__(self, arrays, n_objects, n_types, max_input):
+        """
+        :param arrays: :type dict: The arrays of a model file, keyed by name.
+        """
+        self.arrays = arrays
+        self.n_objects = n_objects
+        self.n_types = n_types
+        self.max_input = max_input
+
+        self.input_map = arrays["input_map"]
+        self.r_map = arrays["r_map"]
+        self.semantical_map = arrays["semantical_map"]
+        self.attention_table = arrays["attention_table"]
+        self.attention_first = arrays["attention_first"]
+        self.attention_second = arrays["attention_second"]
+        self.last_layer = arrays["last_layer"]
+        self.last_symbol = arrays["last_symbol"]
+        self.output_map = arrays["output_map"]
+
+        # Code of each byte in the vocabulary, -1 for bytes that are not in it
+        self.codes = np.full(256, -1, dtype=np.intp)
+        self.codes[arrays["vocabulary"]] = np.arange(len(arrays["vocabulary"]))
+
+    @staticmethod
+    def load(path):
+        """
+        :param path: :type str: A file written by export().
+        :return: :type Model: The model, its arrays memory-mapped.
+        """
+        infile = open(path, "rb")
+        magic = infile.read(len(MAGIC))
+        if magic != MAGIC:
+            infile.close()
+            raise ValueError(path + " is not a model file.")
+        version, header_length = struct.unpack("<II", infile.read(8))
+        if version != VERSION:
+            infile.close()
+            raise ValueError("Model file version %d, expected %d." % (version, VERSION))
+        header = json.loads(infile.read(header_length))
+        start = _aligned(infile.tell())
+        infile.close()
+
+        arrays = {}
+        for name, (dtype, shape, offset) in header["arrays"].items():
+            if np.prod(shape) == 0:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=start + offset, shape=tuple(shape))
+        return Model(arrays, header["n_objects"], header["n_types"], header["max_input"])
+
+    def encode(self, inputs):
+        """
+        :param inputs: :type list (str): Raw inputs.
+        :return: :type tuple: (samples, lengths), the inputs mapped by the input mapper and padded, bytes that are not
+                              in the vocabulary dropped.
+        """
+        lengths = np.array([len(x) for x in inputs], dtype=np.intp)
+        codes = self.codes[np.frombuffer("".join(inputs), dtype=np.uint8)]
+        known = codes >= 0
+        rows = np.repeat(np.arange(len(inputs)), lengths)[known]
+
+        lengths = np.bincount(rows, minlength=len(inputs))
+        columns = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        samples = np.zeros((len(inputs), lengths.max() if len(inputs) else 0), dtype=self.input_map.dtype)
+        samples[rows, columns] = self.input_map[codes[known]]
+        return samples, lengths
+
+    def predict_batch(self, inputs, default=1, chunk_size=256):
+        """Same outputs as Constructor.compute() with the exported genes.
+
+        :param inputs: :type list (str): Raw inputs.
+        :param default: :type int: Output of inputs for which the computer outputs nothing.
+        :param chunk_size: :type int: Number of inputs computed together, bounds memory use.
+        :return: :type np.ndarray: The output of each input.
+        """
+        outputs = np.empty(len(inputs), dtype=np.intp)
+        for start in xrange(0, len(inputs), chunk_size):
+            samples, lengths = self.encode(inputs[start:start + chunk_size])
+            structure = ((self.semantical_map[layer], sizes)
+                         for layer, sizes in layers_batch(self.r_map, samples, lengths, len(self.attention_table)))
+            types, counts = filter_batch(self.attention_table, self.attention_first, self.attention_second, structure,
+                                         len(lengths))[:2]
+            last = compiled_last(self.last_layer, self.last_symbol, types, np.clip(counts - 1, 0, self.max_input))
+            outputs[start:start + chunk_size] = np.where(last >= 0, self.output_map[np.maximum(last, 0)], default)
+        return outputs
+
+    def predict(self, data, default=1):
+        return int(self.predict_batch([data], default)[0])
+
+
+if __name__ == "__main__":
+    model = Model.load(sys.argv[1])
+    for output in model.predict_batch([line.rstrip("\n") for line in sys.stdin]):
+        print output
@@ -7,6 +7,8 @@
 """
 
 import random
+import numpy as np
+from genome import dtype_for
 
 
 class OutputMapper():
@@ -20,20 +22,21 @@ class OutputMapper():
             symbol_set.add(symbol)
 
         self.n_symbols = len(symbol_set)
-        self.map = {x: random.randint(0, self.n_symbols) for x in range(n_types + 1)}
+        self.map = np.array([random.randint(0, self.n_symbols) for x in range(n_types + 1)],
+                            dtype=dtype_for(self.n_symbols))
 
     def set(self, new_mapping):
         """
         :param new_mapping: :type list: A list of size n_types defining the new mapping. The elements should all be ints
-                                        in the range [0, n_symbols).
+                                        in the range [0, n_symbols). Arrays are used without copying.
         :return: None
         """
-        self.map = {x: new_mapping[x] for x in range(self.n_types + 1)}
+        self.map = np.asarray(new_mapping)
 
     def compute(self, data):
         """
         :param data: :type iterable: 1-d data to be mapped according to the current mapping. Data must be integers in
                                      range [0, n_symbols).
-        :return: :type list: A new list of the mapped data.
+        :return: :type np.ndarray: A new array of the mapped data.
         """
-        return [self.map[data[x]] for x in range(len(data))]
+        return self.map[np.asarray(data, dtype=np.intp)]
@@ -0,0 +1,72 @@
+"""Counters of where evaluation time goes, summarised once per generation.
+
+   Use: Give a Constructor a Profile (evolve(profile=True) does) and it adds the time of each stage and statistics of
+        the samples it computes. Call summary() for a one-line report and clear() to start over. Profiles of worker
+        processes are merged into the one of the parent with merge(), so stage times add up over all processes and can
+        exceed the time the generation took.
+"""
+
+import collections
+import time
+
+STAGES = ("decode", "input_mapper", "structure", "semantical_mapper", "attention", "type_computer", "output_mapper")
+
+
+class Profile:
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # Seconds spent per stage
+        self.times = collections.defaultdict(float)
+        # Event counts, see summary()
+        self.counts = collections.defaultdict(int)
+        self.start = time.time()
+
+    def add(self, name, start):
+        """Adds the time since start to the stage name.
+
+        :param start: :type float: A time.time() value.
+        """
+        self.times[name] += time.time() - start
+
+    def count(self, name, n):
+        self.counts[name] += n
+
+    def merge(self, other):
+        """Adds the times and counts of other.
+
+        :param other: :type tuple: (times, counts) of another Profile.
+        """
+        times, counts = other
+        for name, seconds in times.items():
+            self.times[name] += seconds
+        for name, n in counts.items():
+            self.counts[name] += n
+
+    def state(self):
+        return dict(self.times), dict(self.counts)
+
+    def summary(self):
+        """
+        :return: :type str: Time per stage, mean depth and width of the structures computed, the fraction of pairs
+                            attended, the mean number of outputs of the TypeComputer per sample and, when racing, the
+                            individuals abandoned and the train samples they were not scored on. Individuals are
+                            scored in groups sharing their stages up to the structure, the number of groups and of
+                            structures computed once for a group and reused are reported too.
+        """
+        counts = self.counts
+        samples = max(counts["samples"], 1)
+        structures = max(counts["structures"], 1)
+        stages = " ".join("%s %.3fs" % (name, self.times[name]) for name in STAGES if name in self.times)
+        summary = ("Profile: %.3fs, %d individuals, %d samples | %s | depth %.1f width %.1f | attention hits %.2f%% | "
+                   "outputs %.2f/sample") % (time.time() - self.start, counts["individuals"], counts["samples"], stages,
+                                             float(counts["depth"])/structures, float(counts["width"])/structures,
+                                             100.*counts["hits"]/max(counts["pairs"], 1),
+                                             float(counts["outputs"])/samples)
+        if counts["groups"]:
+            summary += " | %d groups, %d structures shared" % (counts["groups"], counts["shared"])
+        if counts["aborted"]:
+            summary += " | aborted %d, %d samples skipped" % (counts["aborted"], counts["skipped"])
+        return summary
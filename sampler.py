@@ -0,0 +1,63 @@
+"""Draws minibatches from shuffled permutations of a dataset split.
+
+   Use: Initialize with the targets of the split, the batch size and a random seed. Each call to next() returns the
+        positions of the next minibatch in the split. The split is shuffled once per epoch and consecutive minibatches
+        are consecutive slices of the shuffled order, so every sample is drawn once per epoch. When the batch size does
+        not divide the split, the minibatch crossing the end of an epoch holds the samples left in it and the first
+        samples of the next one, those not already in the minibatch. With stratified=True, each minibatch holds the
+        classes in about the proportion of the whole split.
+"""
+
+import numpy as np
+
+
+class Sampler:
+
+    def __init__(self, targets, batch_size, seed, stratified=False):
+        """
+        :param targets: :type np.ndarray: The target of each sample of the split.
+        :param batch_size: :type int: Samples per minibatch, at most the size of the split.
+        :param seed: :type int: Seed of the shuffles.
+        :param stratified: :type bool: Whether to spread each class evenly over the minibatches of an epoch.
+        """
+        self.targets = np.asarray(targets)
+        self.batch_size = max(min(batch_size, len(self.targets)), 1)
+        self.stratified = stratified
+        self.random_state = np.random.RandomState(seed)
+
+        self.epoch = -1
+        self.order = np.empty(0, dtype=np.intp)
+        self.position = 0
+
+    def shuffle(self):
+        """Starts a new epoch."""
+        if self.stratified:
+            # Samples of a class get evenly spaced keys in [0, 1), in random order and with random phase. Sorting by key
+            # interleaves the classes.
+            order = self.random_state.permutation(len(self.targets))
+            classes, inverse, counts = np.unique(self.targets[order], return_inverse=True, return_counts=True)
+            rank = np.empty(len(order), dtype=np.intp)
+            by_class = np.argsort(inverse, kind="mergesort")
+            starts = np.cumsum(counts) - counts
+            rank[by_class] = np.arange(len(order)) - np.repeat(starts, counts)
+            keys = (rank + self.random_state.random_sample(len(classes))[inverse])/counts[inverse]
+            self.order = order[np.argsort(keys, kind="mergesort")]
+        else:
+            self.order = self.random_state.permutation(len(self.targets))
+        self.position = 0
+        self.epoch += 1
+
+    def next(self):
+        """
+        :return: :type np.ndarray: Positions in the split of the samples of the next minibatch, in increasing order.
+        """
+        indexes = self.order[self.position:self.position + self.batch_size]
+        self.position += len(indexes)
+        if len(indexes) < self.batch_size:
+            # The rest of the minibatch is drawn from the next epoch, skipping the samples left from this one
+            self.shuffle()
+            picked = np.flatnonzero(~np.in1d(self.order, indexes))[:self.batch_size - len(indexes)]
+            self.order = np.concatenate((self.order[picked], np.delete(self.order, picked)))
+            self.position = len(picked)
+            indexes = np.concatenate((indexes, self.order[:len(picked)]))
+        return np.sort(indexes)
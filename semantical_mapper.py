@@ -5,9 +5,15 @@
          should be integers in the appropriate range (see method). If this is the initial mapping from raw data,
          initialize with the option first_layer=True and set input to a string that contains all symbols present in the
          input data (e.g. all of the input data).
+
+    The mapping is held as a flat integer array: map[x] is the type of object x or, for the first layer, the object of
+    the symbol at position x of symbol_set. When every symbol is a single byte, the first layer also compiles the
+    mapping into a 256-entry table indexed by byte, so a string input is mapped by one str.translate() call.
 """
 
 import random as r
+import numpy as np
+from genome import dtype_for
 
 
 class SemanticalMapper:
@@ -16,7 +22,7 @@ class SemanticalMapper:
         self.n_symbols = n_objects
         self.first_layer = first_layer
         self.symbol_set = []
-        self.map = {}
+        self.index = {}
         self.first_layer = first_layer
         if first_layer:
             symbol_set = set()
@@ -24,32 +30,68 @@ class SemanticalMapper:
             for symbol in inputs:
                 symbol_set.add(symbol)
 
-            self.symbol_set = list(symbol_set)
+            # Genes follow the sorted symbols, the order in which a dataset's vocabulary interns them
+            self.symbol_set = sorted(symbol_set)
+            self.index = {x: i for i, x in enumerate(self.symbol_set)}
+
+            # Bytes of the symbols, the bytes that are not symbols, dropped from inputs, and the code of each byte
+            self.bytes = None
+            self.table = None
+            self.translation = None
+            if all(isinstance(x, str) and len(x) == 1 for x in self.symbol_set):
+                self.bytes = np.frombuffer("".join(self.symbol_set), dtype=np.uint8)
+                self.dropped = "".join(chr(x) for x in xrange(256) if chr(x) not in self.index)
+                self.codes = np.zeros(256, dtype=np.intp)
+                self.codes[self.bytes] = np.arange(len(self.bytes))
 
             self.n_symbols = len(symbol_set)
-            self.map = {x: r.randint(0, self.n_symbols) for x in self.symbol_set}
+            self.set(np.array([r.randint(0, self.n_symbols) for x in self.symbol_set], dtype=dtype_for(self.n_symbols)))
         else:
-            self.map = {x: r.randint(0, n_types) for x in range(self.n_symbols + 1)}
+            self.map = np.array([r.randint(0, n_types) for x in range(self.n_symbols + 1)], dtype=dtype_for(n_types))
 
     def set(self, new_mapping):
         """
         :param new_mapping: :type list: A list of size n_objects defining the new mapping. In the case of first layer,
-                                        a list of size equal to number of symbols in input.
+                                        a list of size equal to number of symbols in input. Arrays are used without
+                                        copying.
         """
-        if self.first_layer:
-            i = 0
-            for key, value in self.map.iteritems():
-                self.map[key] = new_mapping[i]
-                i += 1
-        else:
-            self.map = {x: new_mapping[x] for x in range(self.n_symbols + 1)}
+        self.map = np.asarray(new_mapping)
+        if self.first_layer and self.bytes is not None:
+            self.table = np.zeros(256, dtype=self.map.dtype)
+            self.table[self.bytes] = self.map
+            # Objects fit in a byte unless there are 256 symbols
+            self.translation = self.table.astype(np.uint8).tostring() if self.table.max() < 256 else None
 
     def compute(self, data):
         """
         :param data: :type iterable: 1-d data to be mapped according to the current mapping. Data must be integers in
                                      range [0, n_objects).
-        :return: :type list: A new list of the mapped data.
+        :return: :type np.ndarray: A new array of the mapped data.
         """
+        if self.first_layer and self.table is not None and isinstance(data, str):
+            if self.translation is not None:
+                mapped = data.translate(self.translation, self.dropped)
+                return np.frombuffer(mapped, dtype=np.uint8).astype(self.map.dtype)
+            return self.table.take(np.frombuffer(data.translate(None, self.dropped), dtype=np.uint8))
         if self.first_layer:
-            return [self.map[data[x]] for x in range(len(data)) if data[x] in self.symbol_set]
-        return [self.map[data[x]] for x in range(len(data))]
+            return self.map[self.encode(data)]
+        return self.map[np.asarray(data, dtype=np.intp)]
+
+    def encode(self, data):
+        """First layer only.
+
+        :param data: :type iterable: Raw input symbols.
+        :return: :type np.ndarray: The position of each symbol in symbol_set, i.e. its code in a dataset with the same
+                                   vocabulary. Symbols not in symbol_set are dropped.
+        """
+        if self.bytes is not None and isinstance(data, str):
+            return self.codes[np.frombuffer(data.translate(None, self.dropped), dtype=np.uint8)]
+        return np.array([self.index[x] for x in data if x in self.index], dtype=np.intp)
+
+    def compute_batch(self, data):
+        """
+        :param data: :type np.ndarray: Integer data of any shape, e.g. a padded batch. For the first layer the data
+                                       must be encoded with encode().
+        :return: :type np.ndarray: The mapped data, same shape as data.
+        """
+        return self.map[data]
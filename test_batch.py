@@ -0,0 +1,115 @@
+"""Regression tests of the batched paths against the per-sample compute().
+
+   Use: python -m unittest test_batch
+        Each test builds a Constructor on a small synthetic dataset, see benchmark.synthesize(), and checks that
+        random chromosomes give the same outputs through compute_batch(), an exported Model and grouped scoring as
+        through compute() and score().
+"""
+
+import os
+import random as r
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import model
+from benchmark import random_chromosome, synthesize
+from constructor import Constructor
+from evaluator import PoolEvaluator
+
+# Constructor arguments, from tiny layers to ones wider than the samples. The input mapper maps to as many objects as
+# the dataset has symbols, so n_objects is at least that.
+CONFIGS = [dict(n_objects=40, n_types=6, max_attention_depth=4, max_attention_objects=5, computer_depth=5,
+                n_functions=7),
+           dict(n_objects=30, n_types=20, max_attention_depth=8, max_attention_objects=30, computer_depth=6,
+                n_functions=3),
+           dict(n_objects=16, n_types=17, max_attention_depth=2, max_attention_objects=2, computer_depth=9,
+                n_functions=2)]
+
+N_CHROMOSOMES = 8
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.datafile = os.path.join(self.directory, "data.pkl")
+        synthesize(self.datafile, 60, 30, n_classes=3, n_symbols=8)
+        self.random_state = np.random.RandomState(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def constructors(self, **kwargs):
+        for config in CONFIGS:
+            r.seed(1)
+            yield Constructor(self.datafile, test_fraction=.25, save_file=os.path.join(self.directory, "best.pkl"),
+                              **dict(config, **kwargs))
+
+    def test_compute_batch(self):
+        for constructor in self.constructors():
+            inputs = [constructor.dataset.input(i) for i in xrange(len(constructor.dataset))]
+            samples = constructor.dataset.take(np.arange(len(constructor.dataset)))
+            for i in xrange(N_CHROMOSOMES):
+                constructor.decode(random_chromosome(constructor, self.random_state))
+                expected = [constructor.compute(x) for x in inputs]
+                for chunk_size in (1, 7, 256):
+                    outputs = constructor.compute_batch(samples.samples, samples.lengths, chunk_size=chunk_size)
+                    self.assertEqual(outputs.tolist(), expected)
+
+    def test_stage_cache(self):
+        for constructor in self.constructors(stage_cache_size=2**24):
+            batch = constructor.minibatch("train", np.arange(len(constructor.train_data)))
+            inputs = [constructor.dataset.input(i) for i in constructor.train_data]
+            for i in xrange(N_CHROMOSOMES):
+                digests = constructor.layout.digests(constructor.decode(random_chromosome(constructor,
+                                                                                          self.random_state)))
+                expected = [constructor.compute(x) for x in inputs]
+                # Computed, then read back from the cache
+                for repeat in xrange(2):
+                    outputs = constructor.compute_batch(batch.samples, batch.lengths, chunk_size=len(batch),
+                                                        key=constructor.stage_keys(batch, digests))
+                    self.assertEqual(outputs.tolist(), expected)
+
+    def test_predict_batch(self):
+        path = os.path.join(self.directory, "model.bin")
+        for constructor in self.constructors():
+            inputs = [constructor.dataset.input(i) for i in xrange(len(constructor.dataset))]
+            for i in xrange(N_CHROMOSOMES):
+                constructor.decode(random_chromosome(constructor, self.random_state))
+                expected = [constructor.compute(x) for x in inputs]
+                model.export(constructor, path)
+                loaded = model.Model.load(path)
+                for chunk_size in (1, 7, 256):
+                    self.assertEqual(loaded.predict_batch(inputs, chunk_size=chunk_size).tolist(), expected)
+
+    def test_run_tasks(self):
+        for constructor in self.constructors(fitness_cache_size=0):
+            train_indexes, test_indexes = constructor.draw()
+            genes = []
+            for i in xrange(N_CHROMOSOMES):
+                parent = random_chromosome(constructor, self.random_state)
+                genes.append(parent)
+                # Children sharing the upstream stages of their parent are scored in its group
+                for j in xrange(i % 3):
+                    child = parent.copy()
+                    start = constructor.layout.offsets["attention"]
+                    child[start:] = random_chromosome(constructor, self.random_state)[start:]
+                    genes.append(child)
+
+            tasks = [(g, train_indexes, test_indexes, False, None) for g in genes]
+            expected = [constructor.score(g, train_indexes, test_indexes, report_test=False) for g in genes]
+            self.assertEqual(constructor.run_tasks(tasks), expected)
+            self.assertTrue(max(size for key, size, hits in constructor.group_stats) > 1)
+
+            # Groups larger than a worker's share are split across workers
+            constructor.workers = PoolEvaluator(constructor, 3)
+            try:
+                self.assertEqual(constructor.run_tasks(tasks), expected)
+            finally:
+                constructor.workers.close()
+                constructor.workers = None
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""Tests of successive halving, Constructor.evaluate_halving().
+
+   Use: python -m unittest test_halving
+"""
+
+import hashlib
+import os
+import random as r
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from benchmark import random_chromosome, synthesize
+from constructor import Constructor
+
+N_CHROMOSOMES = 32
+
+
+class HalvingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        datafile = os.path.join(self.directory, "data.pkl")
+        synthesize(datafile, 200, 20, n_classes=2, n_symbols=8)
+        r.seed(1)
+        self.constructor = Constructor(datafile, n_objects=40, n_types=6, max_attention_depth=4,
+                                       max_attention_objects=5, computer_depth=5, n_functions=7, test_fraction=.25,
+                                       save_file=os.path.join(self.directory, "best.pkl"), fitness_cache_size=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_rounds_rank_first(self):
+        constructor = self.constructor
+        # Number of rounds each chromosome was scored in, by the digest of its genes
+        rounds = {}
+        score_tasks = constructor.score_tasks
+
+        def counting(tasks):
+            for task in tasks:
+                key = hashlib.md5(task[0]).digest()
+                rounds[key] = rounds.get(key, 0) + 1
+            return score_tasks(tasks)
+
+        constructor.score_tasks = counting
+        random_state = np.random.RandomState(0)
+        for size, rate in ((3, 2), (5, 3)):
+            constructor.halving = (size, rate)
+            for seed in xrange(5):
+                r.seed(seed)
+                rounds.clear()
+                population = [random_chromosome(constructor, random_state) for i in xrange(N_CHROMOSOMES)]
+                scores = constructor.evaluate_halving(population, report_test=False)
+                reached = [rounds[hashlib.md5(genes).digest()] for genes in population]
+                self.assertTrue(min(scores) >= 0)
+                for i in xrange(N_CHROMOSOMES):
+                    for j in xrange(N_CHROMOSOMES):
+                        if reached[i] < reached[j]:
+                            self.assertLess(scores[i], scores[j])
+
+    def test_rejects_bad_parameters(self):
+        for halving, halving_rate in ((0, 2), (-1, 2), (4, 1), (4, 0)):
+            self.assertRaises(ValueError, self.constructor.evolve, 1, halving=halving, halving_rate=halving_rate)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+"""Tests of the minibatches drawn by sampler.Sampler.
+
+   Use: python -m unittest test_sampler
+"""
+
+import unittest
+import numpy as np
+from sampler import Sampler
+
+# (split size, batch size), batch sizes that divide the split and ones that leave a tail
+SIZES = [(10, 5), (10, 3), (17, 4), (31, 8), (7, 7)]
+
+N_SEEDS = 20
+
+
+def targets(n):
+    """Three classes in proportions 1/2, 1/3 and 1/6."""
+    return np.repeat([0, 1, 2], [n//2, n//3, n - n//2 - n//3])
+
+
+class SamplerTest(unittest.TestCase):
+
+    def test_no_repeats(self):
+        for stratified in (False, True):
+            for n, batch_size in SIZES:
+                for seed in xrange(N_SEEDS):
+                    sampler = Sampler(targets(n), batch_size, seed, stratified)
+                    for i in xrange(3*n):
+                        indexes = sampler.next()
+                        self.assertEqual(len(indexes), batch_size)
+                        self.assertEqual(len(np.unique(indexes)), batch_size)
+
+    def test_once_per_epoch(self):
+        for stratified in (False, True):
+            for n, batch_size in SIZES:
+                for seed in xrange(N_SEEDS):
+                    sampler = Sampler(targets(n), batch_size, seed, stratified)
+                    counts = np.zeros(n, dtype=np.intp)
+                    for i in xrange(3*n):
+                        counts[sampler.next()] += 1
+                        # No sample is drawn a second time before every sample was drawn once
+                        self.assertLessEqual(counts.max() - counts.min(), 1)
+                        if (i + 1)*batch_size % n == 0:
+                            self.assertTrue((counts == (i + 1)*batch_size//n).all())
+
+    def test_stratified(self):
+        for n, batch_size in SIZES:
+            proportions = np.bincount(targets(n))/float(n)
+            for seed in xrange(N_SEEDS):
+                sampler = Sampler(targets(n), batch_size, seed, stratified=True)
+                for i in xrange(3*n):
+                    counts = np.bincount(targets(n)[sampler.next()], minlength=len(proportions))
+                    # A minibatch that crosses epochs may be off by one more than one inside an epoch
+                    self.assertLess(np.abs(counts - batch_size*proportions).max(), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,39 @@
 """Defines path of types through functions as a series of vectors that direct the output of each function to the next.
    Contains a symbol that indicates output of type.
+
+   The path is held as a (depth, max_input) array and the function bank as a (num_functions, n_types + 1) array,
+   functions[f][x] being the result of function f on type x. Each input position runs through its own column of the
+   path, independently of the other positions, so a whole layer of the path is applied to all positions at once.
 """
 
 import random as r
+import numpy as np
+from genome import dtype_for
+
+
+def compiled_last(last_layer, last_symbol, symbols, n_live):
+    """The compiled path of TypeComputer.compute_last().
+
+    :param last_layer: :type np.ndarray: TypeComputer.last_layer, compiled for at least max(n_live) positions.
+    :param last_symbol: :type np.ndarray: TypeComputer.last_symbol, as last_layer.
+    :param symbols: :type np.ndarray: Input symbols of a batch, as for compute_last().
+    :param n_live: :type np.ndarray: The number of positions each sample runs through the path.
+    :return: :type np.ndarray: The last output of each sample, -1 for samples without output.
+    """
+    n_positions = n_live.max() if len(n_live) else 0
+    last = np.full(len(n_live), -1, dtype=np.intp)
+    if n_positions == 0:
+        return last
+    state = np.array(symbols[:, :n_positions], dtype=np.intp)
+    positions = np.arange(n_positions)
+    layers = np.where(positions < n_live[:, None], last_layer[positions, state], -1)
+
+    # The last output is at the last layer that outputs, from the last position that outputs in it
+    order = np.where(layers >= 0, layers*n_positions + positions, -1)
+    rows = np.flatnonzero(order.max(1) >= 0)
+    columns = np.argmax(order[rows], 1)
+    last[rows] = last_symbol[columns, state[rows, columns]]
+    return last
 
 
 class TypeComputer:
@@ -17,8 +48,16 @@ class TypeComputer:
         self.max_input = max_input
         self.num_functions = num_functions
         self.depth = depth
-        self.path = [[r.randint(0, num_functions-1) for x in range(max_input)] for y in range(depth)]
-        self.functions = [{x: r.randint(0, n_types) for x in range(n_types + 1)} for y in range(num_functions)]
+        self.n_types = n_types
+        self.path = np.array([[r.randint(0, num_functions-1) for x in range(max_input)] for y in range(depth)],
+                             dtype=dtype_for(num_functions))
+        self.functions = np.array([[r.randint(0, n_types) for x in range(n_types + 1)] for y in range(num_functions)],
+                                  dtype=np.intp)
+
+        # Compiled path, see compile()
+        self.last_layer = np.empty((0, n_types + 1), dtype=np.intp)
+        self.last_symbol = np.empty((0, n_types + 1), dtype=np.intp)
+        self.n_outputs = np.empty((0, n_types + 1), dtype=np.intp)
 
     def compute(self, symbols):
         """
@@ -27,24 +66,109 @@ class TypeComputer:
         """
 
         o_vector = []
-        for layer in self.path:
-            i = 0
-            for mapping in layer:
-                if i < len(symbols) - 1:
-                    symbol = self.functions[mapping][symbols[i]]
-                    if symbol == 0:  # At 0 the last symbol is output
-                        o_vector.append(symbols[i])
-                    else:
-                        symbols[i] = symbol
-                i += 1
+        n_live = max(min(len(symbols) - 1, self.max_input), 0)
+        state = np.array(symbols[:n_live], dtype=np.intp)
+        for layer in self.path[:, :n_live]:
+            result = self.functions[layer, state]
+            output = result == 0  # At 0 the last symbol is output
+            o_vector += state[output].tolist()
+            state = np.where(output, state, result)
 
         return o_vector
 
+    def compile(self, n_positions):
+        """Compiles the path of the first n_positions input positions. For input position i starting at type x,
+        last_layer[i][x] is the last layer of the path at which it outputs, -1 if it never does, and last_symbol[i][x]
+        the type it outputs then, n_outputs[i][x] the number of times it outputs. Positions already compiled since the
+        last set() are kept.
+
+        :param n_positions: :type int: Number of input positions to compile.
+        """
+        compiled = len(self.last_layer)
+        if n_positions <= compiled:
+            return
+
+        state = np.tile(np.arange(self.n_types + 1), (n_positions - compiled, 1))
+        last_layer = np.full(state.shape, -1, dtype=np.intp)
+        last_symbol = np.zeros(state.shape, dtype=np.intp)
+        n_outputs = np.zeros(state.shape, dtype=np.intp)
+        for k, layer in enumerate(self.path[:, compiled:n_positions]):
+            result = self.functions[layer[:, None], state]
+            output = result == 0
+            last_layer[output] = k
+            last_symbol[output] = state[output]
+            n_outputs += output
+            state = np.where(output, state, result)
+
+        self.last_layer = np.concatenate([self.last_layer, last_layer])
+        self.last_symbol = np.concatenate([self.last_symbol, last_symbol])
+        self.n_outputs = np.concatenate([self.n_outputs, n_outputs])
+
+    def compute_last(self, symbols, counts):
+        """Batched compute() that only keeps the last output of each sample.
+
+        :param symbols: :type np.ndarray: A 2-d array, row i holding the counts[i] input symbols of sample i.
+        :param counts: :type np.ndarray: The number of input symbols of each sample.
+        :return: :type np.ndarray: The last output of each sample, -1 for samples without output.
+        """
+        n_live = np.clip(np.asarray(counts) - 1, 0, self.max_input)
+        n_positions = n_live.max() if len(n_live) else 0
+        last = np.full(len(n_live), -1, dtype=np.intp)
+        if n_positions == 0:
+            return last
+
+        if len(n_live) > self.n_types + 1 or n_positions <= len(self.last_layer):
+            # Compiling a position costs about as much as running n_types + 1 samples through it
+            self.compile(n_positions)
+            return compiled_last(self.last_layer, self.last_symbol, symbols, n_live)
+
+        state = np.array(symbols[:, :n_positions], dtype=np.intp)
+        live = np.arange(n_positions) < n_live[:, None]
+
+        for layer in self.path[:, :n_positions]:
+            result = self.functions[layer, state]
+            output = (result == 0) & live  # At 0 the last symbol is output
+            rows = output.any(1)
+            if rows.any():
+                columns = n_positions - 1 - np.argmax(output[rows, ::-1], 1)
+                last[rows] = state[rows, columns]
+            state = np.where(output, state, result)
+
+        return last
+
+    def count_outputs(self, symbols, counts):
+        """
+        :param symbols: :type np.ndarray: Input symbols of a batch, as for compute_last().
+        :param counts: :type np.ndarray: The number of input symbols of each sample.
+        :return: :type np.ndarray: The number of outputs compute() gives for each sample.
+        """
+        n_live = np.clip(np.asarray(counts) - 1, 0, self.max_input)
+        n_positions = n_live.max() if len(n_live) else 0
+        if n_positions == 0:
+            return np.zeros(len(n_live), dtype=np.intp)
+        self.compile(n_positions)
+        state = np.asarray(symbols[:, :n_positions], dtype=np.intp)
+        live = np.arange(n_positions) < n_live[:, None]
+        return np.where(live, self.n_outputs[np.arange(n_positions), state], 0).sum(1)
+
     def set(self, new_path):
         """Sets a new path for the computer.
 
-        :param new_path: List of size num_input*depth
+        :param new_path: List of size num_input*depth. Arrays are used without copying.
+        """
+
+        self.path = np.asarray(new_path).reshape(self.depth, self.max_input)
+        self.last_layer = self.last_layer[:0]
+        self.last_symbol = self.last_symbol[:0]
+        self.n_outputs = self.n_outputs[:0]
+
+    def set_functions(self, functions):
+        """Sets a new function bank, e.g. the one of a saved computer.
+
+        :param functions: A (num_functions, n_types + 1) array.
         """
 
-        for i in range(self.depth):
-            self.path[i] = new_path[self.max_input*i:self.max_input*(i + 1)]
+        self.functions = np.array(functions, dtype=np.intp).reshape(self.num_functions, self.n_types + 1)
+        self.last_layer = self.last_layer[:0]
+        self.last_symbol = self.last_symbol[:0]
+        self.n_outputs = self.n_outputs[:0]